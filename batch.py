@@ -0,0 +1,224 @@
+"""Headless batch processing with the image-processing helpers.
+
+Applies one or more operations to every image matched by the inputs and
+writes the results to an output directory, using a process pool sized
+to the CPU cores. Files are streamed: only a bounded number of them are
+in flight at any time, so thousands of inputs are fine.
+
+Outputs keep each file's path relative to its input (the directory, or
+the part of a glob pattern before the first wildcard), so ``a/x.jpg``
+and ``b/x.jpg`` from ``"**/*.jpg"`` do not overwrite each other. A file
+reached twice through overlapping inputs is processed once; inputs that
+would still share an output name (``x.jpg`` and ``x.png``) get their
+source extension appended to the stem.
+
+Examples::
+
+    python batch.py "photos/*.jpg" --op background:method=transparent --out out/
+    python batch.py photos/ --op rotation:angle=90 --op blur:k=15,mode=integral --out out/ --format jpeg
+
+Operation names and parameters are those of image_processing.OPERATIONS;
+the chain runs through image_processing.run_pipeline, which fuses steps
+where it can. Large images are filtered tile by tile; when the last
+operation can be tiled and the output is PNG, its strips are streamed
+straight into the encoder instead of assembling the full result first.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+
+import image_processing
+from image_processing import (
+    OPERATIONS,
+    TILED_MIN_PIXELS,
+    image_to_bytes,
+    iter_operation_tiles,
+    load_image,
+    run_pipeline,
+    tile_halo,
+    write_png_strips,
+)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+FORMAT_EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg"}
+
+
+def parse_value(text):
+    """Parse an operation parameter as int, float or plain string."""
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_op_spec(spec):
+    """Parse ``name[:key=value,...]`` into ``(name, params)``."""
+    name, _, args = spec.partition(":")
+    name = name.strip()
+    if name not in OPERATIONS:
+        raise argparse.ArgumentTypeError(
+            f"unknown operation '{name}' (choose from {', '.join(OPERATIONS)})"
+        )
+    params = {}
+    for item in filter(None, args.split(",")):
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"expected key=value, got '{item}'")
+        params[key.strip()] = parse_value(value.strip())
+    return name, params
+
+
+def _glob_root(pattern):
+    """Return the directory part of a glob pattern before its first wildcard."""
+    root = pattern
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root or "."
+
+def iter_input_files(inputs):
+    """Yield ``(path, relative_path)`` of images in files, directories and globs, lazily.
+
+    ``relative_path`` is the path below the input it was found through and
+    names the output file.
+    """
+    for entry in inputs:
+        if os.path.isdir(entry):
+            root = entry
+            candidates = (e.path for e in os.scandir(entry) if e.is_file())
+        elif os.path.isfile(entry):
+            root = os.path.dirname(entry) or "."
+            candidates = iter([entry])
+        else:
+            root = _glob_root(entry)
+            candidates = glob.iglob(entry, recursive=True)
+        for path in candidates:
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                yield path, os.path.relpath(path, root)
+
+def output_name(relative_path, extension, taken):
+    """Output path (relative to the output directory) not yet in ``taken``.
+
+    Collisions get the source extension appended to the stem, then a
+    counter. The chosen name is added to ``taken``.
+    """
+    stem, source_ext = os.path.splitext(relative_path)
+    name = stem + extension
+    if name in taken:
+        stem = f"{stem}_{source_ext.lstrip('.').lower()}"
+        name = stem + extension
+        counter = 2
+        while name in taken:
+            name = f"{stem}_{counter}{extension}"
+            counter += 1
+    taken.add(name)
+    return name
+
+
+def _init_worker():
+    # One thread per process: the pool already uses every core
+    cv2.setNumThreads(1)
+    image_processing.TILE_WORKERS = 1
+
+
+def process_file(path, ops, out_path, fmt):
+    """Load, process and save one image; returns the output path and stage timings."""
+    t0 = time.perf_counter()
+    img = load_image(path)
+    t1 = time.perf_counter()
+    *head, (last_name, last_params) = ops
+    stream = (fmt == "PNG" and tile_halo(last_name, last_params) is not None
+              and img.shape[0] * img.shape[1] >= TILED_MIN_PIXELS)
+    img = run_pipeline(img, head if stream else ops)
+    t2 = time.perf_counter()
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, "wb") as f:
+        if stream:
+            write_png_strips(f, iter_operation_tiles(img, last_name, last_params), img.shape[0])
+        else:
+            f.write(image_to_bytes(img, fmt=fmt))
+    t3 = time.perf_counter()
+    if stream:
+        return out_path, {"load": t1 - t0, "process": t2 - t1, "process+save": t3 - t2}
+    return out_path, {"load": t1 - t0, "process": t2 - t1, "save": t3 - t2}
+
+
+def run_batch(files, ops, out_dir, fmt="PNG", workers=None, max_pending=None):
+    """Process ``files`` in a process pool and print a line per file.
+
+    ``files`` yields ``(path, relative_path)`` as iter_input_files does.
+    Returns ``(processed, failed)`` counts.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    os.makedirs(out_dir, exist_ok=True)
+    processed = failed = 0
+
+    def report(futures):
+        nonlocal processed, failed
+        for future in futures:
+            path = future_paths.pop(future)
+            try:
+                out_path, timings = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"FAILED {path}: {e}", file=sys.stderr)
+                continue
+            processed += 1
+            total = sum(timings.values())
+            stages = ", ".join(f"{stage} {secs:.3f}s" for stage, secs in timings.items())
+            print(f"{path} -> {out_path} ({total:.3f}s: {stages})")
+
+    future_paths = {}
+    seen = set()
+    taken = set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for path, relative_path in files:
+            real_path = os.path.realpath(path)
+            if real_path in seen:
+                continue
+            seen.add(real_path)
+            out_path = os.path.join(out_dir, output_name(relative_path, FORMAT_EXTENSIONS[fmt], taken))
+            if len(future_paths) >= max_pending:
+                done, _ = wait(future_paths, return_when=FIRST_COMPLETED)
+                report(done)
+            future = pool.submit(process_file, path, ops, out_path, fmt)
+            future_paths[future] = path
+        report(list(future_paths))
+    return processed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Batch-process images with the Matrix Transformations helpers."
+    )
+    parser.add_argument("inputs", nargs="+",
+                        help="image files, directories or glob patterns")
+    parser.add_argument("--op", dest="ops", action="append", type=parse_op_spec, required=True,
+                        help="operation as name[:key=value,...]; repeat to chain operations")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--format", choices=["png", "jpeg"], default="png",
+                        help="output format (default: png)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (default: number of CPU cores)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    processed, failed = run_batch(
+        iter_input_files(args.inputs), args.ops, args.out,
+        fmt=args.format.upper(), workers=args.workers
+    )
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {processed} file(s), {failed} failed, in {elapsed:.2f}s ({rate:.2f} files/s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
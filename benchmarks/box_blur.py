@@ -0,0 +1,54 @@
+"""Benchmark: integral-image box blur vs. manual convolution.
+
+Run from the repository root:
+
+    python benchmarks/box_blur.py --width 4000 --height 3000
+
+Prints the runtime of both blur paths for every kernel size offered in
+the blur panel, so the flat cost of the integral image is easy to see.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processing import box_blur_integral, manual_convolution_rgb  # noqa: E402
+
+KERNEL_SIZES = [3, 5, 7, 9, 15, 25, 51, 101]
+
+
+def best_time(func, repeat):
+    """Return the fastest of ``repeat`` runs in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+
+    print(f"Image {args.width}x{args.height} RGB, best of {args.repeat}")
+    print(f"{'k':>5} {'convolution [s]':>16} {'integral [s]':>13}")
+    for k in KERNEL_SIZES:
+        kernel = np.ones((k, k), dtype=np.float32) / (k * k)
+        t_conv = best_time(lambda: manual_convolution_rgb(img, kernel), args.repeat)
+        t_sat = best_time(lambda: box_blur_integral(img, k), args.repeat)
+        print(f"{k:>5} {t_conv:>16.3f} {t_sat:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
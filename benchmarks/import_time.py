@@ -0,0 +1,65 @@
+"""Import-time budget check for the image_processing module.
+
+Run from the repository root:
+
+    python benchmarks/import_time.py --budget 0.5
+
+Imports the module in fresh interpreters, reports the best time and
+exits with status 1 when it exceeds the budget or when a UI/plotting
+dependency (streamlit, matplotlib) gets pulled in at import time.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FORBIDDEN_MODULES = ("streamlit", "matplotlib")
+BUDGET_S = 0.5
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import image_processing
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (FORBIDDEN_MODULES,)
+
+
+def measure_import(repeat):
+    """Return ``(best_seconds, forbidden_modules_loaded)`` over fresh interpreters."""
+    best = float("inf")
+    loaded = set()
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE], cwd=ROOT, check=True,
+            capture_output=True, text=True
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        best = min(best, result["seconds"])
+        loaded.update(result["loaded"])
+    return best, sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=BUDGET_S,
+                        help=f"seconds (default: {BUDGET_S})")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    best, loaded = measure_import(args.repeat)
+    print(f"import image_processing: {best:.3f}s (budget {args.budget:.3f}s, best of {args.repeat})")
+    ok = True
+    if loaded:
+        print(f"FAIL: imported at module load: {', '.join(loaded)}")
+        ok = False
+    if best > args.budget:
+        print("FAIL: over budget")
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""Benchmark suite for the image_processing helpers.
+
+Run from the repository root:
+
+    python benchmarks/suite.py --sizes 0.3 2 12 --output results.json
+    python benchmarks/suite.py --sizes 0.3 2 12 --compare results.json
+
+Every helper is timed on deterministic synthetic images of the requested
+sizes (in megapixels, 4:3). The best of ``--repeat`` runs is reported as
+throughput in MP/s next to the peak memory allocated during one extra
+traced run. Results can be stored as JSON with ``--output``; ``--compare``
+prints the change against such a file and exits with status 1 when any
+case got slower than ``--threshold``.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from io import BytesIO
+
+import cv2
+import numpy as np
+import PIL
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processing import (  # noqa: E402
+    PROXY_MAX_WIDTH,
+    SHARPEN_KERNEL,
+    adjust_brightness_contrast,
+    advanced_background_removal,
+    apply_affine_transform,
+    apply_geometric_steps,
+    box_blur_integral,
+    compute_histogram,
+    detect_edges,
+    image_digest,
+    image_to_bytes,
+    load_image,
+    make_proxy,
+    manual_convolution_gray,
+    manual_convolution_rgb,
+    rgb_to_gray,
+)
+
+DEFAULT_SIZES = [0.3, 2, 12, 48]
+BOX_KERNEL = np.ones((15, 15), dtype=np.float32) / 225
+
+
+def synthetic_image(megapixels, seed=0):
+    """Deterministic 4:3 RGB test image: gradients, noise and a green backdrop.
+
+    Pure noise would make PNG encoding and background removal unrealistic,
+    so the image mixes smooth regions with texture and a green-screen area.
+    """
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(width * 3 / 4))
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[..., 0] = (x * 0.7 + y * 0.3).astype(np.uint8)
+    img[..., 1] = (255 - x * 0.5).astype(np.uint8)
+    img[..., 2] = (y * 0.8).astype(np.uint8)
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(-12, 13, size=(height, width, 1), dtype=np.int16)
+    img = np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    img[:, : width // 3] = (40, 180, 60)  # green-screen strip
+    return img
+
+
+def _rotation(img):
+    h, w = img.shape[:2]
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), 30, 1.0)
+    return apply_affine_transform(img, M)
+
+
+def build_cases(img):
+    """Return ``[(name, callable)]`` for one input image.
+
+    Inputs needed by a case (encoded blobs, grayscale copies) are prepared
+    here so only the helper itself is timed.
+    """
+    gray = rgb_to_gray(img)
+    png = image_to_bytes(img, "PNG")
+    jpeg = image_to_bytes(img, "JPEG")
+    steps = [("rotation", {"angle": 15}), ("scaling", {"sx": 0.9, "sy": 0.9}),
+             ("translation", {"dx": 20, "dy": -10})]
+    return [
+        ("load_image[png]", lambda: load_image(BytesIO(png))),
+        ("load_image[jpeg]", lambda: load_image(BytesIO(jpeg))),
+        ("load_image[jpeg,max_width]", lambda: load_image(BytesIO(jpeg), max_width=PROXY_MAX_WIDTH)),
+        ("image_to_bytes[png]", lambda: image_to_bytes(img, "PNG")),
+        ("image_to_bytes[jpeg]", lambda: image_to_bytes(img, "JPEG")),
+        ("apply_affine_transform", lambda: _rotation(img)),
+        ("apply_geometric_steps", lambda: apply_geometric_steps(img, steps)),
+        ("manual_convolution_gray[3x3]", lambda: manual_convolution_gray(gray, SHARPEN_KERNEL)),
+        ("manual_convolution_rgb[3x3]", lambda: manual_convolution_rgb(img, SHARPEN_KERNEL)),
+        ("manual_convolution_rgb[15x15]", lambda: manual_convolution_rgb(img, BOX_KERNEL)),
+        ("box_blur_integral[15]", lambda: box_blur_integral(img, 15)),
+        ("rgb_to_gray", lambda: rgb_to_gray(img)),
+        ("adjust_brightness_contrast", lambda: adjust_brightness_contrast(img, 20, 30)),
+        ("compute_histogram", lambda: compute_histogram(img)),
+        ("advanced_background_removal[hsv]", lambda: advanced_background_removal(img, "hsv")),
+        ("advanced_background_removal[transparent]",
+         lambda: advanced_background_removal(img, "transparent")),
+        ("advanced_background_removal[blur_bg]", lambda: advanced_background_removal(img, "blur_bg")),
+        ("advanced_background_removal[edge_detection_bg]",
+         lambda: advanced_background_removal(img, "edge_detection_bg")),
+        ("detect_edges[Sobel]", lambda: detect_edges(img, "Sobel")),
+        ("detect_edges[Canny]", lambda: detect_edges(img, "Canny")),
+        ("make_proxy", lambda: make_proxy(img)),
+        ("image_digest", lambda: image_digest(img)),
+    ]
+
+
+def time_case(func, repeat):
+    """Return ``(best, median, peak_bytes)``; peak comes from an extra traced run.
+
+    tracemalloc sees NumPy buffers, including OpenCV outputs allocated
+    through NumPy, but not scratch memory private to C libraries.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), statistics.median(times), peak
+
+
+def environment():
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "pillow": PIL.__version__,
+    }
+
+
+def run_suite(sizes, repeat, only=None):
+    results = []
+    for megapixels in sizes:
+        img = synthetic_image(megapixels)
+        h, w = img.shape[:2]
+        mp = h * w / 1e6
+        print(f"\n{w}x{h} ({mp:.2f} MP), best of {repeat}")
+        print(f"{'case':<48} {'best [s]':>9} {'MP/s':>9} {'peak [MiB]':>11}")
+        for name, func in build_cases(img):
+            if only and not any(pattern in name for pattern in only):
+                continue
+            best, median, peak = time_case(func, repeat)
+            results.append({
+                "case": name,
+                "size_mp": megapixels,
+                "width": w,
+                "height": h,
+                "best_s": best,
+                "median_s": median,
+                "mp_per_s": mp / best if best > 0 else None,
+                "peak_mib": peak / 2**20,
+            })
+            print(f"{name:<48} {best:>9.4f} {mp / best:>9.1f} {peak / 2**20:>11.1f}")
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    """Print the change against a stored run; return the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {(r["case"], r["size_mp"]): r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"\nComparison with {baseline_path} (regression threshold {threshold:.0%})")
+    for r in results:
+        old = baseline.get((r["case"], r["size_mp"]))
+        if old is None:
+            continue
+        change = r["best_s"] / old["best_s"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{r['case']:<48} {r['size_mp']:>5} MP {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=DEFAULT_SIZES,
+                        help="image sizes in megapixels (default: 0.3 2 12 48)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", help="run only cases containing one of these strings")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown counted as a regression (default: 0.10)")
+    args = parser.parse_args()
+
+    results = run_suite(args.sizes, args.repeat, args.only)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "repeat": args.repeat, "results": results},
+                      f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
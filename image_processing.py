@@ -0,0 +1,1374 @@
+"""Image-processing helpers used by the Streamlit app and the batch CLI.
+
+Everything here works on plain NumPy arrays (RGB, uint8) and has no
+Streamlit dependency, so it can be imported by worker processes.
+
+Images stay in RGB order throughout: OpenCV calls use its RGB color
+conversion codes, and order-agnostic operations (warps, scaling, blurs,
+histograms) run on the RGB array directly instead of being wrapped in
+to_opencv()/to_streamlit() copies.
+"""
+import os
+import json
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import threading
+import tracemalloc
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from io import BytesIO
+
+import numpy as np
+import cv2
+from PIL import Image, ImageOps
+
+# Rows processed together by the convolution engine (keeps buffers in cache)
+CONV_BAND_ROWS = 32
+# Relative singular value below which a kernel counts as rank-1 (separable)
+SEPARABLE_TOLERANCE = 1e-6
+# Cost of one FFT element (per log2 of transform size) relative to one
+# multiply-add of the direct backend, measured on NumPy's pocketfft
+FFT_COST_FACTOR = 4.0
+# Memory ceiling of the shared result cache (override with the env variable)
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Directory, disk ceiling and idle timeout (seconds) of the memory-mapped
+# image store for uploads (override with the env variables)
+IMAGE_STORE_DIR = os.environ.get("IMAGE_STORE_DIR", os.path.join(".cache", "images"))
+IMAGE_STORE_MAX_BYTES = int(os.environ.get("IMAGE_STORE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+IMAGE_STORE_MAX_IDLE_S = float(os.environ.get("IMAGE_STORE_MAX_IDLE_S", 3600))
+# Width of the downscaled working copy used for previews in proxy mode
+PROXY_MAX_WIDTH = 1024
+# EXIF orientation tag and the values that swap width and height
+EXIF_ORIENTATION = 0x0112
+EXIF_TRANSPOSED = (5, 6, 7, 8)
+# Height of the row strips processed by the tiled execution mode
+TILE_ROWS = 512
+# Images at least this large are filtered strip by strip by apply_operation
+TILED_MIN_PIXELS = 16_000_000
+# Threads that filter the strips of one image concurrently (env override)
+TILE_WORKERS = int(os.environ.get("TILE_WORKERS", os.cpu_count() or 1))
+# Images at least this large are split across TILE_WORKERS threads
+PARALLEL_MIN_PIXELS = 1_000_000
+
+# ===================== INSTRUMENTATION =====================
+
+# Structured (one JSON object per line) stage records of finished profiles
+PROFILE_LOGGER = logging.getLogger("image_processing.profile")
+
+_active_profile = ContextVar("active_profile", default=None)
+# Number of started, memory-tracing profiles; tracemalloc runs while it is
+# above zero, and is stopped again only if a profile started it
+_tracing_profiles = 0
+_started_tracemalloc = False
+_tracing_lock = threading.Lock()
+
+class Profile:
+    """Opt-in timing and peak-allocation record of the stages run while active.
+
+    Code marks its stages with ``with stage("name"):``; outside an active
+    profile that is a no-op. Peaks come from tracemalloc, which sees NumPy
+    buffers (including OpenCV outputs) and is process-wide, so concurrent
+    sessions can inflate each other's numbers.
+    """
+
+    def __init__(self, label, trace_memory=True):
+        self.label = label
+        self.trace_memory = trace_memory
+        self.records = []
+        self.total_seconds = None
+        self._frames = []
+        self._token = None
+        self._start = None
+        self._counted = False
+
+    def start(self):
+        global _tracing_profiles, _started_tracemalloc
+        if self.trace_memory and not self._counted:
+            with _tracing_lock:
+                if _tracing_profiles == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _started_tracemalloc = True
+                _tracing_profiles += 1
+            self._counted = True
+        self._token = _active_profile.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def stop(self):
+        global _tracing_profiles, _started_tracemalloc
+        if self._token is None:
+            return self
+        self.total_seconds = time.perf_counter() - self._start
+        _active_profile.reset(self._token)
+        self._token = None
+        if self._counted:
+            with _tracing_lock:
+                _tracing_profiles -= 1
+                if _tracing_profiles == 0 and _started_tracemalloc:
+                    tracemalloc.stop()
+                    _started_tracemalloc = False
+            self._counted = False
+        for record in self.records:
+            PROFILE_LOGGER.info(json.dumps(dict(record, profile=self.label)))
+        PROFILE_LOGGER.info(json.dumps(
+            {"profile": self.label, "stage": "total", "seconds": round(self.total_seconds, 6)}
+        ))
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _tracing(self):
+        return self.trace_memory and tracemalloc.is_tracing()
+
+    def _enter_stage(self, name):
+        current = 0
+        if self._tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if self._frames:
+                # reset_peak() below would drop the parent's peak so far
+                self._frames[-1]["peak"] = max(self._frames[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+        record = {"stage": name, "depth": len(self._frames), "seconds": None, "peak_bytes": None}
+        self.records.append(record)
+        self._frames.append({"record": record, "base": current, "peak": current,
+                             "start": time.perf_counter()})
+
+    def _exit_stage(self):
+        frame = self._frames.pop()
+        record = frame["record"]
+        record["seconds"] = round(time.perf_counter() - frame["start"], 6)
+        if self._tracing():
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            record["peak_bytes"] = peak - frame["base"]
+            if self._frames:
+                self._frames[-1]["peak"] = max(self._frames[-1]["peak"], peak)
+
+@contextmanager
+def stage(name):
+    """Time a stage in the active Profile, if there is one."""
+    profile = _active_profile.get()
+    if profile is None:
+        yield
+        return
+    profile._enter_stage(name)
+    try:
+        yield
+    finally:
+        profile._exit_stage()
+
+def load_image(file, max_width=None):
+    """Load an uploaded file (or path) as an upright RGB uint8 array.
+
+    The EXIF orientation of phone photos is applied while decoding, and
+    the array wraps the decoded pixels without another copy, so it is
+    read-only. With ``max_width`` only a preview is needed: JPEGs are
+    decoded in draft mode straight to the smallest libjpeg scale (1/2,
+    1/4 or 1/8) still at least that wide, and an area resize does the
+    rest.
+    """
+    with stage("decode"):
+        img = Image.open(file)
+        if max_width is not None:
+            transposed = img.getexif().get(EXIF_ORIENTATION, 1) in EXIF_TRANSPOSED
+            img.draft("RGB", (1, max_width) if transposed else (max_width, 1))
+        ImageOps.exif_transpose(img, in_place=True)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img_np = np.asarray(img)
+    if max_width is not None:
+        img_np = make_proxy(img_np, max_width)[0]
+    return img_np
+
+def image_size(file):
+    """Return the upright ``(width, height)`` of an image file, read from its header."""
+    with Image.open(file) as img:
+        width, height = img.size
+        if img.getexif().get(EXIF_ORIENTATION, 1) in EXIF_TRANSPOSED:
+            return height, width
+        return width, height
+
+def to_opencv(img_rgb):
+    """Convert RGB numpy array to BGR for OpenCV."""
+    with stage("rgb_to_bgr"):
+        return cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
+
+def to_streamlit(img_bgr):
+    """Convert BGR numpy array to RGB for Streamlit display."""
+    with stage("bgr_to_rgb"):
+        return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+
+def apply_affine_transform(img_rgb, M, output_size=None):
+    """Apply affine transformation to image."""
+    h, w = img_rgb.shape[:2]
+    if output_size is None:
+        output_size = (w, h)
+
+    if M.shape == (3, 3):
+        M_affine = M[0:2, :]
+    else:
+        M_affine = M
+
+    return cv2.warpAffine(
+        img_rgb, M_affine, output_size,
+        flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_REFLECT
+    )
+
+def scale_affine_matrix(M, scale):
+    """Express a 3x3 pixel-space transform in the coordinates of an image resized by ``scale``."""
+    if scale == 1.0:
+        return M
+    S = np.diag([scale, scale, 1.0])
+    S_inv = np.diag([1.0 / scale, 1.0 / scale, 1.0])
+    return (S @ M @ S_inv).astype(np.float32)
+
+def scale_kernel_size(k, scale):
+    """Scale an odd kernel size to an image resized by ``scale`` (stays odd, at least 1)."""
+    return max(1, int(round(k * scale))) | 1
+
+def make_proxy(img, max_width=PROXY_MAX_WIDTH):
+    """Downscale an image to ``max_width`` for previews; returns (proxy, scale)."""
+    h, w = img.shape[:2]
+    if w <= max_width:
+        return img, 1.0
+    scale = max_width / w
+    proxy = cv2.resize(img, (max_width, max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    return proxy, scale
+
+def build_geometric_matrix(kind, params, size):
+    """Return (M, output_size) of one geometric transform on a (w, h) canvas.
+
+    ``kind`` is one of translation, scaling, rotation, shearing or
+    reflection. Rotation and reflection are taken about the canvas
+    center/edges; scaling also scales the output canvas.
+    """
+    w, h = size
+    if kind == "translation":
+        M = np.array([[1, 0, params["dx"]],
+                      [0, 1, params["dy"]],
+                      [0, 0, 1]], dtype=np.float64)
+    elif kind == "scaling":
+        sx, sy = params["sx"], params["sy"]
+        M = np.array([[sx, 0, 0],
+                      [0, sy, 0],
+                      [0, 0, 1]], dtype=np.float64)
+        size = (int(w * sx), int(h * sy))
+    elif kind == "rotation":
+        cx, cy = w / 2, h / 2
+        theta = np.deg2rad(params["angle"])
+        cos_t = np.cos(theta)
+        sin_t = np.sin(theta)
+        R = np.array([[cos_t, -sin_t, 0],
+                      [sin_t,  cos_t, 0],
+                      [0,      0,     1]], dtype=np.float64)
+        T1 = np.array([[1, 0, -cx],
+                       [0, 1, -cy],
+                       [0, 0, 1]], dtype=np.float64)
+        T2 = np.array([[1, 0, cx],
+                       [0, 1, cy],
+                       [0, 0, 1]], dtype=np.float64)
+        M = T2 @ R @ T1
+    elif kind == "shearing":
+        M = np.array([[1,             params["shx"], 0],
+                      [params["shy"], 1,             0],
+                      [0,             0,             1]], dtype=np.float64)
+    elif kind == "reflection":
+        if params["axis"] == "x":
+            M = np.array([[1, 0, 0],
+                          [0, -1, h],
+                          [0, 0, 1]], dtype=np.float64)
+        elif params["axis"] == "y":
+            M = np.array([[-1, 0, w],
+                          [0, 1, 0],
+                          [0, 0, 1]], dtype=np.float64)
+        else:
+            M = np.array([[0, 1, 0],
+                          [1, 0, 0],
+                          [0, 0, 1]], dtype=np.float64)
+    else:
+        raise ValueError(f"Unknown geometric transform: {kind}")
+    return M, size
+
+def compose_geometric_transforms(steps, size):
+    """Multiply a chain of (kind, params) steps into one 3x3 matrix.
+
+    Each step is built on the canvas produced by the steps before it, and
+    later steps are applied after earlier ones (M = M_n @ ... @ M_1).
+    Returns the composed matrix and the final output size.
+    """
+    M = np.eye(3)
+    for kind, params in steps:
+        step_M, size = build_geometric_matrix(kind, params, size)
+        M = step_M @ M
+    return M.astype(np.float32), size
+
+def apply_geometric_steps(img, steps, size=None, scale=1.0):
+    """Warp ``img`` once with the composition of ``steps``.
+
+    ``size`` is the (w, h) canvas the step parameters refer to; with a
+    ``scale`` other than 1 the composed transform is converted to an
+    image resized by that factor (see scale_affine_matrix).
+    """
+    if size is None:
+        size = (img.shape[1], img.shape[0])
+    M, output_size = compose_geometric_transforms(steps, size)
+    if scale != 1.0:
+        M = scale_affine_matrix(M, scale)
+        output_size = (max(1, round(output_size[0] * scale)), max(1, round(output_size[1] * scale)))
+    return apply_affine_transform(img, M, output_size=output_size)
+
+def _kernel_factors(kernel):
+    """Return (column, row) 1-D factors if the kernel is separable, else None."""
+    if kernel.shape[0] == 1:
+        return np.ones(1, dtype=np.float32), kernel[0, :].copy()
+    if kernel.shape[1] == 1:
+        return kernel[:, 0].copy(), np.ones(1, dtype=np.float32)
+    u, s, vt = np.linalg.svd(kernel.astype(np.float64))
+    if s[0] == 0 or s[1] > SEPARABLE_TOLERANCE * s[0]:
+        return None
+    scale = np.sqrt(s[0])
+    column = (u[:, 0] * scale).astype(np.float32)
+    row = (vt[0, :] * scale).astype(np.float32)
+    return column, row
+
+def _store_band(acc, out_band):
+    """Clip a float accumulator to 0..255 and write it into a uint8 band."""
+    np.clip(acc, 0, 255, out=acc)
+    out_band[...] = acc
+
+def _convolve_direct(padded, kernel, output):
+    """Direct backend: accumulate one shifted view of the image per kernel tap."""
+    k_h, k_w = kernel.shape
+    h, w = output.shape[:2]
+    acc = np.empty((CONV_BAND_ROWS,) + output.shape[1:], dtype=np.float32)
+    scratch = np.empty_like(acc)
+
+    for top in range(0, h, CONV_BAND_ROWS):
+        bottom = min(top + CONV_BAND_ROWS, h)
+        acc_band = acc[:bottom - top]
+        tmp = scratch[:bottom - top]
+        acc_band.fill(0)
+        for i in range(k_h):
+            for j in range(k_w):
+                weight = kernel[i, j]
+                if weight == 0:
+                    continue
+                np.multiply(padded[top + i:bottom + i, j:j + w], weight, out=tmp)
+                acc_band += tmp
+        _store_band(acc_band, output[top:bottom])
+
+def _convolve_separable(padded, column, row, output):
+    """Separable backend: a horizontal 1-D pass followed by a vertical one."""
+    k_h = len(column)
+    h, w = output.shape[:2]
+    horizontal = np.empty((CONV_BAND_ROWS + k_h - 1,) + output.shape[1:], dtype=np.float32)
+    scratch = np.empty_like(horizontal)
+    acc = np.empty((CONV_BAND_ROWS,) + output.shape[1:], dtype=np.float32)
+
+    for top in range(0, h, CONV_BAND_ROWS):
+        bottom = min(top + CONV_BAND_ROWS, h)
+        rows = bottom - top
+        band_in = padded[top:bottom + k_h - 1]
+        band_h = horizontal[:rows + k_h - 1]
+        tmp = scratch[:rows + k_h - 1]
+        band_h.fill(0)
+        for j, weight in enumerate(row):
+            if weight == 0:
+                continue
+            np.multiply(band_in[:, j:j + w], weight, out=tmp)
+            band_h += tmp
+
+        acc_band = acc[:rows]
+        tmp = scratch[:rows]
+        acc_band.fill(0)
+        for i, weight in enumerate(column):
+            if weight == 0:
+                continue
+            np.multiply(band_h[i:i + rows], weight, out=tmp)
+            acc_band += tmp
+        _store_band(acc_band, output[top:bottom])
+
+def _convolve_fft(padded, kernel, output):
+    """FFT backend: multiply spectra instead of sliding the kernel."""
+    k_h, k_w = kernel.shape
+    h, w = output.shape[:2]
+    fft_h = cv2.getOptimalDFTSize(padded.shape[0])
+    fft_w = cv2.getOptimalDFTSize(padded.shape[1])
+    # Flipping the kernel turns the FFT convolution into the same
+    # correlation the direct backend computes.
+    kernel_spectrum = np.fft.rfft2(kernel[::-1, ::-1], s=(fft_h, fft_w))
+
+    # Channels are transformed one at a time to bound the spectrum memory
+    planes = [(padded, output)] if padded.ndim == 2 else [
+        (padded[:, :, c], output[:, :, c]) for c in range(padded.shape[2])
+    ]
+    for plane, out_plane in planes:
+        spectrum = np.fft.rfft2(plane.astype(np.float32), s=(fft_h, fft_w))
+        spectrum *= kernel_spectrum
+        full = np.fft.irfft2(spectrum, s=(fft_h, fft_w))
+        _store_band(full[k_h - 1:k_h - 1 + h, k_w - 1:k_w - 1 + w], out_plane)
+
+def select_convolution_backend(kernel, image_shape):
+    """Pick the cheapest convolution backend for a kernel and image size.
+
+    Costs are estimated in units of one multiply-add per pixel:
+    direct needs one per non-zero tap, separable one per 1-D tap, and
+    FFT grows with the transform size times its logarithm.
+    """
+    kernel = np.asarray(kernel, dtype=np.float32)
+    k_h, k_w = kernel.shape
+    h, w = image_shape[:2]
+    area = h * w
+
+    costs = {"direct": area * np.count_nonzero(kernel)}
+    if k_h > 1 and k_w > 1 and _kernel_factors(kernel) is not None:
+        costs["separable"] = area * (k_h + k_w)
+    fft_area = (cv2.getOptimalDFTSize(h + k_h - 1) *
+                cv2.getOptimalDFTSize(w + k_w - 1))
+    costs["fft"] = FFT_COST_FACTOR * fft_area * np.log2(max(fft_area, 2))
+    return min(costs, key=costs.get)
+
+def _convolve_into(img, kernel, output, backend="auto"):
+    """Convolve an HxW or HxWxC image into a preallocated uint8 output.
+
+    All channels share one reflect-padded buffer, which keeps the input
+    dtype (uint8 uploads are not widened to float), and results are
+    written band by band into ``output``.
+    """
+    kernel = np.asarray(kernel, dtype=np.float32)
+    k_h, k_w = kernel.shape
+    pad_h = k_h // 2
+    pad_w = k_w // 2
+
+    if img.dtype not in (np.uint8, np.float32):
+        img = img.astype(np.float32)
+    pad_width = ((pad_h, pad_h), (pad_w, pad_w)) + ((0, 0),) * (img.ndim - 2)
+    padded = np.pad(img, pad_width, mode="reflect")
+
+    if backend == "auto":
+        backend = select_convolution_backend(kernel, img.shape)
+
+    if backend == "direct":
+        _convolve_direct(padded, kernel, output)
+    elif backend == "separable":
+        factors = _kernel_factors(kernel)
+        if factors is None:
+            raise ValueError("Kernel is not separable")
+        _convolve_separable(padded, factors[0], factors[1], output)
+    elif backend == "fft":
+        _convolve_fft(padded, kernel, output)
+    else:
+        raise ValueError(f"Unknown convolution backend: {backend}")
+    return output
+
+def manual_convolution_gray(img_gray, kernel, backend="auto"):
+    """Apply manual convolution on grayscale image.
+
+    The kernel is slid over the reflect-padded image by one of three
+    backends: "direct" (one vectorized multiply-add per kernel tap),
+    "separable" (two 1-D passes for rank-1 kernels such as box blur) or
+    "fft" (frequency-domain product for large kernels). With "auto" the
+    cheapest backend is chosen by select_convolution_backend.
+    """
+    output = np.empty(img_gray.shape[:2], dtype=np.uint8)
+    return _convolve_into(img_gray, kernel, output, backend)
+
+def manual_convolution_rgb(img_rgb, kernel, backend="auto"):
+    """Apply convolution to all channels of an image in a single pass.
+
+    Accepts HxW, HxWx1, HxWx3 and HxWx4 arrays. For RGBA images only the
+    color channels are filtered and the alpha channel is kept as is.
+    """
+    if img_rgb is None:
+        return None
+
+    if img_rgb.ndim == 2:
+        return manual_convolution_gray(img_rgb, kernel, backend)
+
+    channels = img_rgb.shape[2]
+    if channels not in (1, 3, 4):
+        raise ValueError(f"Unexpected number of channels: {channels}")
+
+    output = np.empty(img_rgb.shape, dtype=np.uint8)
+    if channels == 4:
+        _convolve_into(img_rgb[:, :, :3], kernel, output[:, :, :3], backend)
+        output[:, :, 3] = img_rgb[:, :, 3]
+    else:
+        _convolve_into(img_rgb, kernel, output, backend)
+    return output
+
+def box_blur_integral(img, k):
+    """Box blur through a summed-area table (integral image).
+
+    Every output pixel is the difference of four table entries, so the
+    cost per pixel does not depend on the kernel size. The table is kept
+    in uint32: sums may wrap around, but the four-corner difference is
+    still exact because a single box sum always fits in 32 bits.
+    Reflect padding and RGBA handling match manual_convolution_rgb.
+    """
+    if img is None:
+        return None
+
+    if img.ndim == 3 and img.shape[2] == 4:
+        output = np.empty(img.shape, dtype=np.uint8)
+        output[:, :, :3] = box_blur_integral(img[:, :, :3], k)
+        output[:, :, 3] = img[:, :, 3]
+        return output
+
+    pad = k // 2
+    pad_width = ((pad, k - 1 - pad), (pad, k - 1 - pad)) + ((0, 0),) * (img.ndim - 2)
+    padded = np.pad(img, pad_width, mode="reflect")
+
+    # Leading zero row/column so every box is a plain four-corner lookup
+    sat = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1) + padded.shape[2:], dtype=np.uint32)
+    np.cumsum(padded, axis=0, dtype=np.uint32, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, dtype=np.uint32, out=sat[1:, 1:])
+
+    box = sat[k:, k:] - sat[:-k, k:]
+    box -= sat[k:, :-k]
+    box += sat[:-k, :-k]
+    box //= k * k
+    return box.astype(np.uint8)
+
+def rgb_to_gray(img_rgb):
+    """Convert RGB to grayscale and return as 2D array."""
+    if img_rgb is None:
+        return None
+        
+    if img_rgb.ndim == 2:
+        return img_rgb
+    
+    if img_rgb.dtype != np.float32:
+        img_rgb = img_rgb.astype(np.float32)
+    
+    gray = np.dot(img_rgb[..., :3], [0.299, 0.587, 0.114])
+    return np.clip(gray, 0, 255).astype(np.uint8)
+
+def adjust_brightness_contrast(img_rgb, brightness=0, contrast=0):
+    """Adjust brightness and contrast with input validation."""
+    if img_rgb is None:
+        return None
+    
+    if img_rgb.dtype != np.uint8:
+        img_rgb = img_rgb.astype(np.uint8)
+    
+    beta = brightness
+    alpha = 1 + (contrast / 100.0)
+    return cv2.convertScaleAbs(img_rgb, alpha=alpha, beta=beta)
+
+def image_to_bytes(img_array, fmt="PNG"):
+    """Convert numpy image array to bytes for download."""
+    if img_array is None:
+        raise ValueError("image_to_bytes received None image")
+    
+    if img_array.dtype != np.uint8:
+        img_array = np.clip(img_array, 0, 255).astype(np.uint8)
+    
+    if img_array.ndim == 2:
+        pil_img = Image.fromarray(img_array, mode='L')
+    elif img_array.ndim == 3:
+        if img_array.shape[2] == 3:
+            pil_img = Image.fromarray(img_array, mode='RGB')
+        elif img_array.shape[2] == 4:
+            pil_img = Image.fromarray(img_array, mode='RGBA')
+        else:
+            raise ValueError(f"Unexpected image shape: {img_array.shape}")
+    else:
+        raise ValueError(f"Unexpected image dimensions: {img_array.ndim}")
+    
+    buf = BytesIO()
+    
+    if fmt.upper() == "JPEG":
+        if img_array.ndim == 3 and img_array.shape[2] == 4:
+            pil_img = pil_img.convert('RGB')
+        elif img_array.ndim == 2:
+            pil_img = pil_img.convert('RGB')
+    
+    with stage(f"encode_{fmt.lower()}"):
+        pil_img.save(buf, format=fmt)
+    return buf.getvalue()
+
+def compute_histogram(img_rgb):
+    """Compute and return histogram figure."""
+    if img_rgb is None:
+        return None
+    # matplotlib is only needed here; importing it lazily keeps the module
+    # cheap to import. A bare Figure needs no pyplot backend or cleanup.
+    from matplotlib.figure import Figure
+        
+    # Channel index in RGB order, plotted blue, green, red as before
+    channels = ((2, 'b'), (1, 'g'), (0, 'r'))
+    fig = Figure(figsize=(8, 4))
+    ax = fig.subplots()
+    for i, col in channels:
+        hist = cv2.calcHist([img_rgb], [i], None, [256], [0, 256])
+        ax.plot(hist, color=col)
+        ax.set_xlim([0, 256])
+    ax.set_title("Color Histogram")
+    ax.set_xlabel("Pixel value")
+    ax.set_ylabel("Frequency")
+    fig.tight_layout()
+    return fig
+
+# Green-screen range in OpenCV HSV (H in 0..179). The mask used to OR this
+# with the narrower [35, 50, 50]..[85, 255, 255], which it already contains.
+GREEN_SCREEN_LOWER = np.array([25, 40, 40])
+GREEN_SCREEN_UPPER = np.array([95, 255, 255])
+MASK_KERNEL = np.ones((5, 5), np.uint8)
+# Two successive passes with MASK_KERNEL act like one pass with this kernel
+MASK_KERNEL_TWICE = np.ones((9, 9), np.uint8)
+
+def green_screen_mask(img_rgb):
+    """Return 255 where a pixel belongs to the green background and 0 elsewhere.
+
+    The mask is cleaned with a 5x5 close, open and dilate, i.e. dilate,
+    erode, erode, dilate, dilate. Repeated flat erosions (dilations)
+    compose into one with the summed kernel, so this runs as dilate 5x5,
+    erode 9x9, dilate 9x9, ping-ponging between two mask buffers.
+    """
+    hsv = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2HSV)
+    mask = cv2.inRange(hsv, GREEN_SCREEN_LOWER, GREEN_SCREEN_UPPER)
+    del hsv
+    scratch = np.empty_like(mask)
+    cv2.dilate(mask, MASK_KERNEL, dst=scratch)
+    cv2.erode(scratch, MASK_KERNEL_TWICE, dst=mask)
+    cv2.dilate(mask, MASK_KERNEL_TWICE, dst=scratch)
+    return scratch
+
+def _solid_image(shape, color):
+    """Image of one color, filled row-wise (far faster than broadcasting a pixel)."""
+    img = np.empty(shape, dtype=np.uint8)
+    img.reshape(shape[0], -1)[:] = np.tile(np.asarray(color, dtype=np.uint8), shape[1])
+    return img
+
+def advanced_background_removal(img_rgb, method="hsv", bg_color=(255, 255, 255), mask=None):
+    """Advanced background removal with multiple methods.
+
+    ``mask`` may pass a precomputed green_screen_mask of ``img_rgb``, so
+    trying several methods on one image only repeats the composite.
+    An alpha channel (e.g. from an earlier "transparent" pass) is dropped
+    first, as the BGR conversion of the original implementation did.
+    """
+    if img_rgb is None:
+        return None
+    if img_rgb.ndim == 3 and img_rgb.shape[2] == 4:
+        img_rgb = cv2.cvtColor(img_rgb, cv2.COLOR_RGBA2RGB)
+        
+    # Create mask for green background (assuming green screen)
+    if mask is None:
+        mask = green_screen_mask(img_rgb)
+    return composite_background(img_rgb, mask, method, bg_color)
+
+def composite_background(img_rgb, mask, method="hsv", bg_color=(255, 255, 255)):
+    """Replace the masked (255) background pixels of an RGB image according to ``method``."""
+    if method == "transparent":
+        # Create RGBA image with transparency (alpha is the inverted mask)
+        rgba = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2RGBA)
+        np.subtract(255, mask, out=rgba[:, :, 3])
+        return rgba
+    
+    if method == "hsv":
+        # White background (bg_color has always been given in BGR order)
+        background = _solid_image(img_rgb.shape, bg_color[::-1])
+        
+    elif method == "blur_bg":
+        # Blurred background
+        background = cv2.GaussianBlur(img_rgb, (51, 51), 0)
+        
+    elif method == "grayscale_bg":
+        # Grayscale background
+        background = cv2.cvtColor(cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY), cv2.COLOR_GRAY2RGB)
+        
+    elif method == "edge_detection_bg":
+        # Edge detection background
+        gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+        edges = cv2.Canny(gray, 100, 200)
+        background = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
+        
+    else:
+        # Solid color background
+        if method == "red":
+            bg_color_rgb = (255, 0, 0)
+        elif method == "blue":
+            bg_color_rgb = (0, 0, 255)
+        elif method == "yellow":
+            bg_color_rgb = (255, 255, 0)
+        elif method == "green":
+            bg_color_rgb = (0, 255, 0)
+        elif method == "purple":
+            bg_color_rgb = (255, 0, 255)
+        elif method == "orange":
+            bg_color_rgb = (255, 165, 0)
+        elif method == "pink":
+            bg_color_rgb = (255, 192, 203)
+        elif method == "brown":
+            bg_color_rgb = (165, 42, 42)
+        elif method == "black":
+            bg_color_rgb = (0, 0, 0)
+        else:
+            bg_color_rgb = (255, 255, 255)
+        
+        background = _solid_image(img_rgb.shape, bg_color_rgb)
+    
+    # The mask is strictly 0/255, so foreground-AND plus background-AND
+    # plus saturating add is a plain masked copy into the output.
+    result = img_rgb.copy()
+    cv2.copyTo(background, mask, result)
+    return result
+
+def detect_edges(img_rgb, method="Sobel"):
+    """Detect edges with Sobel magnitude or Canny and return an RGB image."""
+    if img_rgb is None:
+        return None
+
+    gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+    if method == "Sobel":
+        grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+        grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+        mag = cv2.magnitude(grad_x, grad_y)
+        mag = np.clip(mag, 0, 255).astype(np.uint8)
+        return cv2.cvtColor(mag, cv2.COLOR_GRAY2RGB)
+    edges = cv2.Canny(gray, 100, 200)
+    return cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
+
+def image_digest(img):
+    """Return a short content hash of an image array (shape and dtype included)."""
+    img = np.ascontiguousarray(img)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{img.shape}|{img.dtype}".encode())
+    h.update(img.data)
+    return h.hexdigest()
+
+def file_digest(data):
+    """Return a short content hash of an encoded file's bytes."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _freeze_params(params):
+    """Turn operation parameters into a hashable cache-key component."""
+    if isinstance(params, dict):
+        return tuple((k, _freeze_params(v)) for k, v in sorted(params.items()))
+    if isinstance(params, (list, tuple)):
+        return tuple(_freeze_params(v) for v in params)
+    if isinstance(params, np.ndarray):
+        return (params.shape, str(params.dtype), params.tobytes())
+    if isinstance(params, np.generic):
+        return params.item()
+    return params
+
+class ResultCache:
+    """Thread-safe LRU cache of processed images with a memory ceiling.
+
+    Entries are keyed by (image digest, operation name, parameters) and
+    evicted least-recently-used first once ``max_bytes`` is exceeded.
+    Cached arrays are marked read-only because they are shared between
+    reruns and sessions.
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _nbytes(value):
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        return 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def get_last(self, keys):
+        """Return ``(index, value)`` of the last cached key in ``keys``, else ``(-1, None)``.
+
+        Counts as one lookup: a hit (that entry becomes most recently
+        used) or a miss, however many keys are probed.
+        """
+        with self._lock:
+            for index in range(len(keys) - 1, -1, -1):
+                if keys[index] in self._entries:
+                    self._entries.move_to_end(keys[index])
+                    self.hits += 1
+                    return index, self._entries[keys[index]]
+            self.misses += 1
+            return -1, None
+
+    def put(self, key, value):
+        size = self._nbytes(value)
+        if size > self.max_bytes:
+            return value
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._nbytes(self._entries.pop(key))
+            self._entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= self._nbytes(evicted)
+        return value
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, computing and storing it on a miss."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+def result_key(digest, op_name, params):
+    """Cache key of an operation applied to the image identified by ``digest``."""
+    return (digest, op_name, _freeze_params(params))
+
+class ImageStore:
+    """Content-addressed store of images as memory-mapped ``.npy`` files.
+
+    Images come back as read-only memory maps, so their pages live in the
+    OS page cache: all sessions and server processes opening the same key
+    share one copy, which the kernel can reclaim under pressure instead
+    of it growing each process's private memory.
+
+    A file's modification time records its last use, across processes.
+    Files unused for ``max_idle_s`` are evicted, then the least recently
+    used ones while the store exceeds ``max_bytes``. Maps that are still
+    open stay valid after their file is removed (POSIX); where the OS
+    refuses the removal, the next sweep retries it.
+    """
+
+    def __init__(self, directory=IMAGE_STORE_DIR, max_bytes=IMAGE_STORE_MAX_BYTES,
+                 max_idle_s=IMAGE_STORE_MAX_IDLE_S):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_idle_s = max_idle_s
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key):
+        """Return the stored image as a read-only memory map, or None."""
+        path = self._path(key)
+        try:
+            img = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return img
+
+    def put(self, key, img):
+        """Store ``img`` under ``key`` unless present; returns the stored map.
+
+        If the store cannot be written (read-only deployments) ``img``
+        itself is returned.
+        """
+        stored = self.get(key)
+        if stored is not None:
+            return stored
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(img))
+            os.replace(tmp_path, path)
+        except OSError:
+            return img
+        self.evict()
+        stored = self.get(key)
+        return img if stored is None else stored
+
+    def put_bytes(self, key, data):
+        """Store encoded file bytes under ``key``; returns them as a uint8 map."""
+        return self.put(key, np.frombuffer(data, dtype=np.uint8))
+
+    def get_or_compute(self, key, compute):
+        """Return the stored image for ``key``, computing and storing it on a miss."""
+        stored = self.get(key)
+        if stored is None:
+            stored = self.put(key, compute())
+        return stored
+
+    def _files(self):
+        """Return ``[(mtime, size, path)]`` of the stored images, oldest first."""
+        files = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return files
+        for entry in entries:
+            if not entry.name.endswith(".npy"):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+        files.sort()
+        return files
+
+    def evict(self, now=None):
+        """Remove idle images, then the least recently used ones over ``max_bytes``."""
+        now = time.time() if now is None else now
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if now - mtime <= self.max_idle_s and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def stats(self):
+        files = self._files()
+        return {
+            "entries": len(files),
+            "bytes": sum(size for _, size, _ in files),
+            "max_bytes": self.max_bytes,
+        }
+
+def make_square_thumbnail(path, size=180):
+    """Center-crop an image to a square, resize it and return JPEG bytes.
+
+    JPEG sources are decoded in draft mode, i.e. already downscaled by
+    the decoder to the smallest scale that still covers ``size``.
+    """
+    img = Image.open(path)
+    img.draft("RGB", (size, size))
+    ImageOps.exif_transpose(img, in_place=True)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    width, height = img.size
+    min_dim = min(width, height)
+    left = (width - min_dim) // 2
+    top = (height - min_dim) // 2
+    right = left + min_dim
+    bottom = top + min_dim
+    img_cropped = img.crop((left, top, right, bottom))
+    img_resized = img_cropped.resize((size, size), Image.Resampling.LANCZOS)
+
+    buffered = BytesIO()
+    img_resized.save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+# ===================== NAMED OPERATIONS =====================
+
+SHARPEN_KERNEL = np.array(
+    [[0, -1, 0],
+     [-1, 5, -1],
+     [0, -1, 0]],
+    dtype=np.float32
+)
+
+BACKGROUND_METHODS = [
+    "hsv", "blur_bg", "transparent", "grayscale_bg", "edge_detection_bg",
+    "red", "blue", "yellow", "green", "purple", "orange", "pink", "brown",
+    "black", "white",
+]
+
+def _op_blur(img, k=3, mode="conv"):
+    k = int(k)
+    if mode == "integral":
+        return box_blur_integral(img, k)
+    kernel = np.ones((k, k), dtype=np.float32) / (k * k)
+    return manual_convolution_rgb(img, kernel)
+
+def _op_sharpen(img):
+    sharpened = manual_convolution_gray(rgb_to_gray(img), SHARPEN_KERNEL)
+    return cv2.cvtColor(sharpened, cv2.COLOR_GRAY2RGB)
+
+def _op_grayscale(img):
+    return cv2.cvtColor(rgb_to_gray(img), cv2.COLOR_GRAY2RGB)
+
+def _op_geometry(kind):
+    def op(img, **params):
+        return apply_geometric_steps(img, [(kind, params)])
+    return op
+
+# Name -> callable(img, **params) for every tool of the app
+OPERATIONS = {
+    "translation": _op_geometry("translation"),
+    "scaling": _op_geometry("scaling"),
+    "rotation": _op_geometry("rotation"),
+    "shearing": _op_geometry("shearing"),
+    "reflection": _op_geometry("reflection"),
+    "blur": _op_blur,
+    "sharpen": _op_sharpen,
+    "grayscale": _op_grayscale,
+    "edges": lambda img, method="Sobel": detect_edges(img, method),
+    "brightness": lambda img, brightness=0, contrast=0: adjust_brightness_contrast(img, brightness, contrast),
+    "background": lambda img, method="hsv": advanced_background_removal(img, method),
+}
+
+# Name -> callable(**params) returning the rows of context one output row
+# depends on, for the operations that can run in tiled mode. None means
+# the given parameters make the operation non-local (Canny's hysteresis
+# follows edges across the whole image).
+TILE_HALOS = {
+    "blur": lambda k=3, mode="conv": k // 2,
+    "sharpen": lambda: SHARPEN_KERNEL.shape[0] // 2,
+    "grayscale": lambda: 0,
+    "edges": lambda method="Sobel": 1 if method == "Sobel" else None,
+    "brightness": lambda brightness=0, contrast=0: 0,
+}
+
+def tile_halo(name, params=None):
+    """Halo rows a tiled run of an operation needs, or None if it cannot be tiled."""
+    if name not in TILE_HALOS:
+        return None
+    return TILE_HALOS[name](**(params or {}))
+
+def apply_operation(img, name, params=None, tile_rows=None, workers=None):
+    """Apply a named operation from OPERATIONS with keyword parameters.
+
+    Tileable operations run strip by strip (see process_tiled) when
+    ``tile_rows`` is given or the image is large: from PARALLEL_MIN_PIXELS
+    the strips are spread over ``workers`` threads (default TILE_WORKERS),
+    and from TILED_MIN_PIXELS they are used even on a single thread.
+    """
+    if name not in OPERATIONS:
+        raise ValueError(f"Unknown operation: {name}")
+    params = params or {}
+    workers = TILE_WORKERS if workers is None else workers
+    halo = tile_halo(name, params)
+    if tile_rows is None and halo is not None:
+        tile_rows = choose_tile_rows(img.shape, halo, workers)
+    with stage(name):
+        if tile_rows and halo is not None:
+            return process_tiled(img, lambda strip: OPERATIONS[name](strip, **params),
+                                 halo, tile_rows, workers)
+        return OPERATIONS[name](img, **params)
+
+# ===================== TILED EXECUTION =====================
+
+def iter_tiles(img, func, halo, tile_rows=TILE_ROWS):
+    """Yield ``func`` applied to horizontal strips of ``img``, one strip at a time.
+
+    Each strip is extended by ``halo`` rows of real image context above
+    and below (clamped at the image border) and the halo is cropped from
+    the result again. For a filter whose footprint reaches at most
+    ``halo`` rows this gives exactly the rows of the whole-image result,
+    while all of its temporaries only ever cover one strip.
+    """
+    for bounds in _tile_bounds(img.shape[0], halo, tile_rows):
+        yield _run_tile(img, func, bounds)
+
+def _tile_bounds(height, halo, tile_rows):
+    """Yield (top, bottom, src_top, src_bottom) of every strip and its halo."""
+    for top in range(0, height, tile_rows):
+        bottom = min(top + tile_rows, height)
+        yield top, bottom, max(0, top - halo), min(height, bottom + halo)
+
+def _run_tile(img, func, bounds):
+    top, bottom, src_top, src_bottom = bounds
+    return func(img[src_top:src_bottom])[top - src_top:bottom - src_top]
+
+def choose_tile_rows(shape, halo, workers):
+    """Strip height apply_operation uses for an image, or None to run it whole."""
+    pixels = shape[0] * shape[1]
+    if workers > 1 and pixels >= PARALLEL_MIN_PIXELS:
+        return parallel_tile_rows(shape[0], halo, workers)
+    if pixels >= TILED_MIN_PIXELS:
+        return TILE_ROWS
+    return None
+
+def parallel_tile_rows(height, halo, workers):
+    """Strip height giving each worker a few strips without drowning in halo rows."""
+    rows = -(-height // (workers * 4))
+    return int(min(TILE_ROWS, max(rows, 32, 2 * halo)))
+
+def process_tiled(img, func, halo, tile_rows=TILE_ROWS, workers=1, out=None):
+    """Run ``func`` tile by tile (see iter_tiles) into one preallocated output.
+
+    With ``workers`` > 1 the strips are filtered concurrently by a thread
+    pool; NumPy and OpenCV release the GIL inside their kernels. Every
+    strip writes a disjoint row range of the output, so no locking is
+    needed, and at most ``workers`` strips' temporaries are alive at once.
+    ``out`` is used as the output buffer when its shape and dtype fit and
+    it is not ``img`` itself.
+    """
+    bounds = list(_tile_bounds(img.shape[0], halo, tile_rows))
+    first = _run_tile(img, func, bounds[0])
+    shape = (img.shape[0],) + first.shape[1:]
+    if out is not None and out.shape == shape and out.dtype == first.dtype and out is not img:
+        output = out
+    else:
+        output = np.empty(shape, dtype=first.dtype)
+    output[:len(first)] = first
+
+    def fill(b):
+        output[b[0]:b[1]] = _run_tile(img, func, b)
+
+    if workers > 1 and len(bounds) > 2:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # list() re-raises the first exception of any strip
+            list(pool.map(fill, bounds[1:]))
+    else:
+        for b in bounds[1:]:
+            fill(b)
+    return output
+
+def iter_operation_tiles(img, name, params=None, tile_rows=TILE_ROWS):
+    """Yield the result strips of a tileable named operation (for streaming encoders)."""
+    params = params or {}
+    halo = tile_halo(name, params)
+    if halo is None:
+        raise ValueError(f"Operation cannot be tiled: {name}")
+    return iter_tiles(img, lambda strip: OPERATIONS[name](strip, **params), halo, tile_rows)
+
+def write_png_strips(fileobj, strips, height, compress_level=6):
+    """Stream row strips of a uint8 gray, RGB or RGBA image into a PNG file.
+
+    Rows are Up-filtered and deflated as the strips arrive, so the full
+    image never has to exist in memory. ``height`` is the total number of
+    rows, which the PNG header needs before the first strip.
+    """
+    color_types = {1: 0, 3: 2, 4: 6}
+
+    def write_chunk(tag, data):
+        fileobj.write(struct.pack(">I", len(data)))
+        fileobj.write(tag)
+        fileobj.write(data)
+        fileobj.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(tag))))
+
+    compressor = zlib.compressobj(compress_level)
+    previous = None
+    for strip in strips:
+        strip = np.asarray(strip, dtype=np.uint8)
+        if previous is None:
+            channels = 1 if strip.ndim == 2 else strip.shape[2]
+            if channels not in color_types:
+                raise ValueError(f"Unexpected number of channels: {channels}")
+            fileobj.write(b"\x89PNG\r\n\x1a\n")
+            write_chunk(b"IHDR", struct.pack(">IIBBBBB", strip.shape[1], height, 8,
+                                             color_types[channels], 0, 0, 0))
+            previous = np.zeros(strip.shape[1] * channels, dtype=np.uint8)
+        rows = strip.reshape(len(strip), -1)
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 2  # "Up" filter: difference to the row above, mod 256
+        np.subtract(rows[0], previous, out=filtered[0, 1:])
+        np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+        previous = rows[-1].copy()
+        data = compressor.compress(filtered.tobytes())
+        if data:
+            write_chunk(b"IDAT", data)
+    if previous is None:
+        raise ValueError("write_png_strips received no rows")
+    write_chunk(b"IDAT", compressor.flush())
+    write_chunk(b"IEND", b"")
+
+# ===================== PIPELINES =====================
+
+GEOMETRIC_OPERATIONS = ("translation", "scaling", "rotation", "shearing", "reflection")
+# Operations that map each pixel on its own and are fused into one pass
+POINTWISE_OPERATIONS = ("brightness", "grayscale")
+
+_IDENTITY_LUT = np.arange(256, dtype=np.uint8)
+
+def brightness_lut(brightness=0, contrast=0):
+    """256-entry table equal to adjust_brightness_contrast on uint8 values."""
+    return cv2.convertScaleAbs(_IDENTITY_LUT.reshape(1, -1), alpha=1 + contrast / 100.0, beta=brightness).ravel()
+
+# rgb_to_gray of a gray pixel: not quite the identity, because of rounding
+_REGRAY_LUT = rgb_to_gray(np.repeat(_IDENTITY_LUT, 3).reshape(1, 256, 3)).ravel()
+
+def _fuse_pointwise(steps):
+    """Fold a run of brightness/grayscale steps into one strip function.
+
+    Brightness tables compose by lookup, so the run collapses into at most
+    a color table, one grayscale conversion and a gray table. Once the
+    image is gray all three channels are equal, so later steps act on the
+    single gray plane.
+    """
+    color_lut = None
+    gray_lut = None
+    to_gray = False
+    for name, params in steps:
+        if name == "brightness":
+            lut = brightness_lut(**params)
+        elif to_gray:
+            lut = _REGRAY_LUT
+        else:
+            to_gray = True
+            continue
+        if to_gray:
+            gray_lut = lut if gray_lut is None else lut[gray_lut]
+        else:
+            color_lut = lut if color_lut is None else lut[color_lut]
+
+    def apply(strip):
+        if strip.dtype != np.uint8:
+            strip = strip.astype(np.uint8)
+        if color_lut is not None:
+            strip = cv2.LUT(strip, color_lut)
+        if not to_gray:
+            return strip
+        gray = rgb_to_gray(strip)
+        if gray_lut is not None:
+            gray = cv2.LUT(gray, gray_lut)
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+    return apply
+
+def _segment_function(steps):
+    """Chain the steps of a tiled segment into one strip function."""
+    funcs = []
+    run = []
+    for name, params in steps:
+        if name in POINTWISE_OPERATIONS:
+            run.append((name, params))
+            continue
+        if run:
+            funcs.append(_fuse_pointwise(run))
+            run = []
+        funcs.append(lambda strip, name=name, params=params: OPERATIONS[name](strip, **params))
+    if run:
+        funcs.append(_fuse_pointwise(run))
+
+    def apply(strip):
+        for func in funcs:
+            strip = func(strip)
+        return strip
+    return apply
+
+def plan_pipeline(steps, split_pointwise=False):
+    """Group pipeline steps into stages: ``[(kind, steps)]``.
+
+    "warp" stages are runs of geometric steps, composed into one affine
+    warp. "tiled" stages are runs of local operations, executed strip by
+    strip with the halos of all their steps added up, so no full-size
+    intermediate exists between them. Anything else is a "whole" stage
+    run on the whole image.
+
+    With ``split_pointwise`` runs of pointwise steps get tiled stages of
+    their own instead of joining a neighbouring filter, so they can be
+    recomputed without it.
+    """
+    stages = []
+    previous = None
+    for name, params in steps:
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {name}")
+        if name in GEOMETRIC_OPERATIONS:
+            kind = "warp"
+        elif tile_halo(name, params) is not None:
+            kind = "tiled"
+        else:
+            kind = "whole"
+        group = (kind, split_pointwise and name in POINTWISE_OPERATIONS)
+        if stages and group == previous and kind != "whole":
+            stages[-1][1].append((name, params))
+        else:
+            stages.append((kind, [(name, params)]))
+        previous = group
+    return stages
+
+def _scale_step(name, params, scale):
+    """Express pixel-sized parameters for an image resized by ``scale``."""
+    if name == "blur" and scale != 1.0:
+        return name, dict(params, k=scale_kernel_size(params.get("k", 3), scale))
+    return name, params
+
+def run_pipeline(img, steps, size=None, scale=1.0, workers=None, cache=None, digest=None):
+    """Apply a chain of named operations as planned by plan_pipeline.
+
+    ``size`` is the original-resolution size the geometric steps refer to
+    and ``scale`` the resize factor of ``img`` relative to it (previews).
+    Full-size buffers of finished stages are recycled as outputs of later
+    tiled stages.
+
+    With a ResultCache ``cache`` every stage output is stored under the
+    input ``digest`` (computed if not given) and all steps up to that
+    stage. A run resumes after the longest cached prefix, so changing one
+    parameter recomputes only its stage and the ones after it. Pointwise
+    steps then form stages of their own, so a brightness tweak does not
+    recompute the filter before it. Buffers are not recycled, because
+    cached arrays are shared.
+    """
+    workers = TILE_WORKERS if workers is None else workers
+    if size is None:
+        size = (img.shape[1], img.shape[0])
+    stages = plan_pipeline([(name, dict(params or {})) for name, params in steps],
+                           split_pointwise=cache is not None)
+
+    # Size (in original-resolution pixels) entering each stage
+    sizes = []
+    for kind, stage_steps in stages:
+        sizes.append(size)
+        if kind == "warp":
+            size = compose_geometric_transforms(stage_steps, size)[1]
+
+    current = img
+    first = 0
+    keys = []
+    if cache is not None:
+        if digest is None:
+            digest = image_digest(img)
+        prefix = []
+        for kind, stage_steps in stages:
+            prefix.extend(stage_steps)
+            keys.append(result_key(digest, "pipeline_stage",
+                                   {"steps": list(prefix), "size": sizes[0], "scale": scale}))
+        index, cached = cache.get_last(keys)
+        if cached is not None:
+            current = cached
+            first = index + 1
+
+    spare = None
+    for i in range(first, len(stages)):
+        kind, stage_steps = stages[i]
+        size = sizes[i]
+        with stage(f"pipeline.{kind}"):
+            if kind == "warp":
+                result = apply_geometric_steps(current, stage_steps, size, scale)
+            elif kind == "tiled":
+                stage_steps = [_scale_step(name, params, scale) for name, params in stage_steps]
+                halo = sum(tile_halo(name, params) for name, params in stage_steps)
+                # Always strip-wise, so the segment never holds a full-size intermediate
+                tile_rows = choose_tile_rows(current.shape, halo, workers) or max(TILE_ROWS, 4 * halo)
+                result = process_tiled(current, _segment_function(stage_steps), halo,
+                                       tile_rows, workers, out=spare)
+            else:
+                name, params = _scale_step(*stage_steps[0], scale)
+                result = apply_operation(current, name, params, workers=workers)
+        if cache is not None:
+            result = cache.put(keys[i], result)
+        elif current is not img and current is not result:
+            spare = current
+        current = result
+    return current
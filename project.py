@@ -1,13 +1,37 @@
 import streamlit as st
-import numpy as np
 import cv2
-from PIL import Image
-import matplotlib
-matplotlib.use('Agg')  # Non-interactive backend
-import matplotlib.pyplot as plt
 import os
-from io import BytesIO
 import base64
+import hashlib
+import logging
+import time
+from io import BytesIO
+
+from image_processing import (
+    BACKGROUND_METHODS,
+    PROFILE_LOGGER,
+    PROXY_MAX_WIDTH,
+    RESULT_CACHE_MAX_BYTES,
+    ImageStore,
+    Profile,
+    ResultCache,
+    advanced_background_removal,
+    apply_geometric_steps,
+    apply_operation,
+    compute_histogram,
+    file_digest,
+    green_screen_mask,
+    image_digest,
+    image_size,
+    image_to_bytes,
+    load_image,
+    make_proxy,
+    make_square_thumbnail,
+    result_key,
+    run_pipeline,
+    scale_kernel_size,
+    stage,
+)
 
 # ===================== CONFIG & THEME =====================
 
@@ -18,16 +42,31 @@ st.set_page_config(
 )
 
 # ---------- VIDEO BACKGROUND (HTML langsung) ----------
+@st.cache_resource
+def _video_data_url(video_path: str):
+    """Read and base64-encode the video once per process."""
+    with open(video_path, "rb") as f:
+        data = f.read()
+    b64 = base64.b64encode(data).decode("utf-8")
+    return f"data:video/mp4;base64,{b64}"
+
 def set_video_background(video_path: str):
-    """Set an mp4 video as full-screen background using HTML/CSS."""
+    """Set an mp4 video as full-screen background using HTML/CSS.
+
+    Videos under ``static/`` are referenced by URL when static file
+    serving is enabled (see .streamlit/config.toml), so every rerun sends
+    only a short <video> tag and the browser caches the file. Otherwise
+    the video is inlined as a data URL that is encoded once per process.
+    """
     if not os.path.exists(video_path):
         st.warning(f"Video background tidak ditemukan: {video_path}")
         return
 
-    with open(video_path, "rb") as f:
-        data = f.read()
-    b64 = base64.b64encode(data).decode("utf-8")
-    video_data_url = f"data:video/mp4;base64,{b64}"
+    rel_path = os.path.relpath(video_path, "static")
+    if st.get_option("server.enableStaticServing") and not rel_path.startswith(".."):
+        video_src = f"app/static/{rel_path.replace(os.sep, '/')}"
+    else:
+        video_src = _video_data_url(video_path)
 
     st.markdown(
         f"""
@@ -48,13 +87,13 @@ def set_video_background(video_path: str):
         }}
         </style>
         <video class="video-bg" autoplay muted loop playsinline>
-            <source src="{video_data_url}" type="video/mp4">
+            <source src="{video_src}" type="video/mp4">
         </video>
         """,
         unsafe_allow_html=True,
     )
 
-set_video_background("assets/background.mp4")
+set_video_background("static/background.mp4")
 
 # ----- Initialize Session State -----
 if "theme_mode" not in st.session_state:
@@ -65,10 +104,17 @@ if "original_img" not in st.session_state:
     st.session_state.original_img = None
 if "geo_transform" not in st.session_state:
     st.session_state["geo_transform"] = None
+if "pipeline_steps" not in st.session_state:
+    st.session_state["pipeline_steps"] = []
 if "image_filter" not in st.session_state:
     st.session_state["image_filter"] = None
 if "current_page" not in st.session_state:
     st.session_state["current_page"] = "tools"
+if "original_digest" not in st.session_state:
+    st.session_state["original_digest"] = None
+if "proxy_img" not in st.session_state:
+    st.session_state["proxy_img"] = None
+    st.session_state["proxy_scale"] = 1.0
 
 # ===================== TRANSLATIONS =====================
 
@@ -93,6 +139,11 @@ translations = {
         "upload_success": "✅ Gambar berhasil diunggah!",
         "upload_preview": "🖼️ Pratinjau Gambar Asli",
         "upload_info": "⬆️ Silakan unggah gambar terlebih dahulu untuk menggunakan alat di bawah ini.",
+        "proxy_mode": "⚡ Pratinjau cepat (resolusi layar)",
+        "proxy_help": "Pratinjau dihitung pada salinan gambar yang diperkecil. Hasil resolusi penuh dibuat saat diunduh.",
+        "live_preview": "🎚️ Pratinjau langsung saat slider digeser",
+        "live_help": "Translasi, skala, rotasi, shear, brightness/kontras dan pipeline yang sedang diedit langsung ditampilkan pada salinan kecil setiap kali slider berubah. Tombol Terapkan tetap membuat hasil resolusi penuh.",
+        "live_caption": "Pratinjau langsung",
         "tools_title": "🛠️ **Alat Pengolahan Gambar**",
         "tools_subtitle": "🎛️ Pilih transformasi atau filter untuk memulai",
         "geo_title": "🔁 **Transformasi Geometri**",
@@ -122,10 +173,23 @@ translations = {
         "refl_settings": "🪞 **Pengaturan Refleksi**",
         "refl_axis": "Sumbu refleksi",
         "refl_result": "**Hasil Refleksi**",
+        "stack_title": "🧱 **Pipeline Pemrosesan**",
+        "stack_desc": "Transformasi yang berurutan dikalikan menjadi satu matriks, sehingga gambar hanya di-resample sekali. Filter yang berurutan diproses per potongan baris tanpa salinan gambar penuh di antaranya, dengan brightness dan grayscale digabung dalam satu lintasan.",
+        "btn_stack_add": "➕ Tambah ke pipeline",
+        "btn_stack_apply": "Terapkan pipeline",
+        "btn_stack_undo": "↩️ Hapus terakhir",
+        "btn_stack_clear": "🗑️ Kosongkan",
+        "stack_result": "**Hasil Pipeline**",
         "hist_title": "📊 **Histogram Gambar**",
         "hist_desc": "Analisis distribusi intensitas pixel untuk optimasi brightness dan kontras.",
         "btn_histogram": "Tampilkan Histogram 📈",
         "hist_warning": "Silakan unggah gambar terlebih dahulu untuk menampilkan histogram.",
+        "debug_title": "🛠️ Debug: Performa",
+        "profile_mode": "Ukur waktu dan memori setiap tahap",
+        "profile_help": "Mencatat durasi dan puncak alokasi memori tiap tahap (decode, filter, konversi warna, encode, tampilan) dan menuliskannya ke log.",
+        "profile_empty": "Aktifkan pengukuran untuk melihat rincian tahap pada proses berikutnya.",
+        "profile_stage": "Tahap",
+        "profile_total": "Total proses: {ms:.1f} ms · Cache hasil: {hits} hit, {misses} miss",
         "filter_title": "🧮 **Filtering Gambar**",
         "filter_desc": "Modifikasi nilai pixel melalui konvolusi untuk berbagai efek visual.",
         "btn_blur": "🔲 Blur",
@@ -137,6 +201,9 @@ translations = {
         "filter_info": "🔔 Silakan unggah gambar terlebih dahulu untuk menggunakan filter.",
         "blur_settings": "🔲 **Pengaturan Filter Blur**",
         "blur_kernel": "Ukuran kernel",
+        "blur_mode": "Metode blur",
+        "blur_mode_conv": "Konvolusi manual",
+        "blur_mode_integral": "Integral image (cepat untuk kernel besar)",
         "blur_result": "**Hasil Blur**",
         "sharpen_settings": "✨ **Pengaturan Filter Sharpen**",
         "sharpen_desc": "Tingkatkan detail dan tepi pada gambar.",
@@ -188,6 +255,11 @@ translations = {
         "upload_success": "✅ Image uploaded successfully!",
         "upload_preview": "🖼️ Original Image Preview",
         "upload_info": "⬆️ Please upload an image first to use the tools below.",
+        "proxy_mode": "⚡ Fast preview (screen resolution)",
+        "proxy_help": "Previews are computed on a downscaled copy of the image. The full-resolution result is rendered when you download it.",
+        "live_preview": "🎚️ Live preview while moving sliders",
+        "live_help": "Translation, scaling, rotation, shear, brightness/contrast and the pipeline being edited are shown on a small copy every time a slider changes. Apply still renders the full-resolution result.",
+        "live_caption": "Live preview",
         "tools_title": "🛠️ **Image Processing Tools**",
         "tools_subtitle": "🎛️ Select transformation or filter to begin",
         "geo_title": "🔁 **Geometric Transformations**",
@@ -217,10 +289,23 @@ translations = {
         "refl_settings": "🪞 **Reflection Settings**",
         "refl_axis": "Reflection axis",
         "refl_result": "**Reflection Result**",
+        "stack_title": "🧱 **Processing Pipeline**",
+        "stack_desc": "Consecutive transforms are multiplied into a single matrix, so the image is resampled only once. Consecutive filters run strip by strip without full-size copies in between, with brightness and grayscale fused into one pass.",
+        "btn_stack_add": "➕ Add to pipeline",
+        "btn_stack_apply": "Apply pipeline",
+        "btn_stack_undo": "↩️ Remove last",
+        "btn_stack_clear": "🗑️ Clear",
+        "stack_result": "**Pipeline Result**",
         "hist_title": "📊 **Image Histogram**",
         "hist_desc": "Analyze pixel intensity distribution for brightness and contrast optimization.",
         "btn_histogram": "Show Histogram 📈",
         "hist_warning": "Please upload an image first to display the histogram.",
+        "debug_title": "🛠️ Debug: Performance",
+        "profile_mode": "Measure time and memory of every stage",
+        "profile_help": "Records the duration and peak memory allocation of each stage (decode, filter, color conversion, encode, display) and writes them to the log.",
+        "profile_empty": "Turn on measuring to see a stage breakdown of the next run.",
+        "profile_stage": "Stage",
+        "profile_total": "Run total: {ms:.1f} ms · Result cache: {hits} hits, {misses} misses",
         "filter_title": "🧮 **Image Filtering**",
         "filter_desc": "Modify pixel values through convolution for various visual effects.",
         "btn_blur": "🔲 Blur",
@@ -232,6 +317,9 @@ translations = {
         "filter_info": "🔔 Please upload an image first to use the filters.",
         "blur_settings": "🔲 **Blur Filter Settings**",
         "blur_kernel": "Kernel size",
+        "blur_mode": "Blur method",
+        "blur_mode_conv": "Manual convolution",
+        "blur_mode_integral": "Integral image (fast for large kernels)",
         "blur_result": "**Blur Result**",
         "sharpen_settings": "✨ **Sharpen Filter Settings**",
         "sharpen_desc": "Enhance details and edges in the image.",
@@ -851,249 +939,331 @@ st.markdown("""
 
 # ===================== HELPER FUNCTIONS =====================
 
-def load_image(file):
-    """Load image from uploaded file and convert to RGB numpy array."""
-    img = Image.open(file).convert("RGB")
-    img_np = np.array(img)
-    return img_np
-
-def to_opencv(img_rgb):
-    """Convert RGB numpy array to BGR for OpenCV."""
-    return cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
-
-def to_streamlit(img_bgr):
-    """Convert BGR numpy array to RGB for Streamlit display."""
-    return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-
-def apply_affine_transform(img_rgb, M, output_size=None):
-    """Apply affine transformation to image."""
-    img_bgr = to_opencv(img_rgb)
-    h, w = img_bgr.shape[:2]
-    if output_size is None:
-        output_size = (w, h)
-
-    if M.shape == (3, 3):
-        M_affine = M[0:2, :]
-    else:
-        M_affine = M
+# On-disk cache for the square team photo thumbnails
+THUMBNAIL_CACHE_DIR = os.path.join(".cache", "thumbnails")
+
+# Stage profiling starts switched on when IMAGE_PROFILING=1
+PROFILING_DEFAULT = os.environ.get("IMAGE_PROFILING") == "1"
+
+# Live previews aim to finish within this budget; the working copy is
+# resized between these widths to stay inside it
+LIVE_PREVIEW_BUDGET_S = 0.05
+LIVE_PREVIEW_MAX_WIDTH = 640
+LIVE_PREVIEW_MIN_WIDTH = 160
+
+BLUR_KERNEL_SIZES = [3, 5, 7, 9, 15, 25, 51, 101]
+
+# Editable parameters of queued pipeline steps, with the same ranges and
+# choices as the tool panels: (param, label, min, max) for sliders and
+# (param, label, options, option label prefix) for select boxes
+STEP_SLIDERS = {
+    "translation": [("dx", "trans_dx", -200, 200), ("dy", "trans_dy", -200, 200)],
+    "scaling": [("sx", "scale_x", 0.1, 3.0), ("sy", "scale_y", 0.1, 3.0)],
+    "rotation": [("angle", "rot_angle", -180, 180)],
+    "shearing": [("shx", "shear_x", -1.0, 1.0), ("shy", "shear_y", -1.0, 1.0)],
+    "brightness": [("brightness", "bright_brightness", -100, 100), ("contrast", "bright_contrast", -100, 100)],
+}
+STEP_CHOICES = {
+    "reflection": [("axis", "refl_axis", ["x", "y", "diag"], "axis_")],
+    "blur": [("k", "blur_kernel", BLUR_KERNEL_SIZES, None), ("mode", "blur_mode", ["conv", "integral"], "blur_mode_")],
+    "edges": [("method", "edge_method", ["Sobel", "Canny"], None)],
+    "background": [("method", "bg_method", BACKGROUND_METHODS, None)],
+}
+
+if not PROFILE_LOGGER.handlers:
+    _profile_handler = logging.StreamHandler()
+    _profile_handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    PROFILE_LOGGER.addHandler(_profile_handler)
+    PROFILE_LOGGER.setLevel(logging.INFO)
+
+@st.cache_resource
+def get_result_cache():
+    """Process-wide result cache shared by all sessions and reruns."""
+    return ResultCache(RESULT_CACHE_MAX_BYTES)
+
+@st.cache_resource
+def get_image_store():
+    """Memory-mapped store of decoded uploads shared by sessions and processes."""
+    return ImageStore()
+
+def load_upload(uploaded_file):
+    """Prepare an upload; returns ``(digest, size, proxy, proxy_scale, load_original)``.
+
+    The digest of the file bytes identifies the upload in every cache and
+    ``size`` is the upright full-resolution (w, h). Large JPEGs are only
+    decoded at preview resolution here (draft mode), which is all the
+    first preview needs; ``load_original()`` decodes the full image when
+    an export, the histogram or proxy-off mode asks for it. Both come
+    from the image store as read-only memory maps, so sessions keep only
+    light handles and identical uploads are decoded and stored once. The
+    encoded bytes ``load_original`` decodes from are kept there too rather
+    than in the session: the loader holds a map of them, which stays
+    readable after the store evicts the file.
+    """
+    data = uploaded_file.getvalue()
+    digest = file_digest(data)
+    store = get_image_store()
+    encoded = store.put_bytes(f"{digest}-upload", data)
+
+    def load_original():
+        return store.get_or_compute(digest, lambda: load_image(BytesIO(encoded)))
+
+    size = image_size(BytesIO(data))
+    if size[0] <= PROXY_MAX_WIDTH:
+        return digest, size, load_original(), 1.0, load_original
+    proxy = store.get_or_compute(f"{digest}-preview{PROXY_MAX_WIDTH}",
+                                 lambda: load_image(BytesIO(data), max_width=PROXY_MAX_WIDTH))
+    return digest, size, proxy, proxy.shape[1] / size[0], load_original
+
+def get_original():
+    """Full-resolution upload, decoded on first use; None without an upload."""
+    if st.session_state.original_img is None:
+        load_original = st.session_state.get("original_loader")
+        if load_original is None:
+            return None
+        st.session_state.original_img = load_original()
+    return st.session_state.original_img
+
+def cached_result(op_name, params, compute, digest=None):
+    """Run ``compute`` for an operation on the uploaded image, reusing earlier results.
+
+    ``digest`` identifies the input image and defaults to the digest of
+    the current upload.
+    """
+    if digest is None:
+        digest = st.session_state.get("original_digest")
+    if digest is None:
+        return compute()
+    return get_result_cache().get_or_compute(result_key(digest, op_name, params), compute)
+
+def process_image(op_name, params, compute, cache_result=True):
+    """Run ``compute(img, scale)`` on the uploaded image for preview and export.
+
+    Returns ``(preview, full)``. In proxy mode the preview is computed on
+    the downscaled working copy and ``full`` is a callable that renders
+    the full-resolution result only when it is needed (a download).
+    Otherwise both are the same full-resolution result. ``scale`` lets
+    ``compute`` convert pixel-based parameters to the image it receives.
+    Pass ``cache_result=False`` when ``compute`` caches its own output
+    (pipelines cache every stage), so results are not stored twice.
+    """
+    # Read in the script thread: downloads call full() without session state
+    original = st.session_state.original_img
+    load_original = st.session_state.get("original_loader")
+    digest = st.session_state.get("original_digest")
+    cache = get_result_cache()
+
+    def render():
+        return compute(original if original is not None else load_original(), 1.0)
+
+    def full():
+        with stage(f"{op_name}.full"):
+            if digest is None or not cache_result:
+                return render()
+            return cache.get_or_compute(result_key(digest, op_name, params), render)
+
+    proxy = st.session_state.get("proxy_img")
+    scale = st.session_state.get("proxy_scale", 1.0)
+    if st.session_state.get("proxy_mode", True) and proxy is not None and scale < 1.0:
+        with stage(f"{op_name}.preview"):
+            if not cache_result:
+                return compute(proxy, scale), full
+            preview = cached_result(op_name, dict(params, proxy_scale=scale),
+                                    lambda: compute(proxy, scale), digest=digest)
+        return preview, full
+
+    original = get_original()
+    result = full()
+    return result, result
+
+def make_cached_green_screen_mask():
+    """Return ``mask(img, scale)``: the cached green-screen mask of the upload.
+
+    ``img`` is the upload or its proxy (``scale`` < 1). The mask depends
+    only on the image, so it is computed once per upload and switching the
+    background method only repeats the composite. The digest and cache
+    are read here, in the script thread: deferred downloads call ``mask``
+    from Streamlit's media thread, which has no session state.
+    """
+    digest = st.session_state.get("original_digest")
+    cache = get_result_cache()
+
+    def mask(img, scale):
+        if digest is None:
+            return green_screen_mask(img)
+        return cache.get_or_compute(
+            result_key(digest, "green_screen_mask", {"scale": scale}),
+            lambda: green_screen_mask(img)
+        )
 
-    transformed = cv2.warpAffine(
-        img_bgr, M_affine, output_size,
-        flags=cv2.INTER_LINEAR,
-        borderMode=cv2.BORDER_REFLECT
+    return mask
+
+def geometry_job(steps):
+    """Cache parameters and ``compute(img, scale)`` for a chain of geometric steps."""
+    size = st.session_state["original_size"]
+    steps = [(kind, dict(params)) for kind, params in steps]
+    return {"steps": steps}, lambda img, s: apply_geometric_steps(img, steps, size, s)
+
+def process_geometry(steps):
+    """Preview/export a chain of geometric steps on the uploaded image with one warp."""
+    return process_image("geometry", *geometry_job(steps))
+
+def pipeline_job(steps):
+    """Cache parameters and ``compute(img, scale)`` for a queued pipeline.
+
+    Stage outputs go to the shared result cache, so a pipeline that only
+    differs in a later step reuses the earlier stages.
+    """
+    size = st.session_state["original_size"]
+    digest = st.session_state.get("original_digest")
+    cache = get_result_cache()
+    steps = [(name, dict(params)) for name, params in steps]
+    return {"steps": steps}, lambda img, s: run_pipeline(
+        img, steps, size, s, cache=cache, digest=digest
     )
-    return to_streamlit(transformed)
-
-def manual_convolution_gray(img_gray, kernel):
-    """Apply manual convolution on grayscale image."""
-    k_h, k_w = kernel.shape
-    pad_h = k_h // 2
-    pad_w = k_w // 2
-    
-    img_float = img_gray.astype(np.float32)
-    padded = np.pad(img_float, ((pad_h, pad_h), (pad_w, pad_w)), mode="reflect")
-    h, w = img_gray.shape
-    output = np.zeros((h, w), dtype=np.float32)
-    
-    for i in range(h):
-        for j in range(w):
-            region = padded[i:i + k_h, j:j + k_w]
-            output[i, j] = np.sum(region * kernel)
-    
-    output = np.clip(output, 0, 255)
-    return output.astype(np.uint8)
 
-def manual_convolution_rgb(img_rgb, kernel):
-    """Apply convolution to each RGB channel separately."""
-    if img_rgb is None:
-        return None
-        
-    channels = []
-    for c in range(3):  # RGB channels
-        channel = img_rgb[:, :, c]
-        if channel.ndim > 2:
-            channel = channel.squeeze()
-        convolved = manual_convolution_gray(channel.astype(np.float32), kernel)
-        channels.append(convolved)
-    output = np.stack(channels, axis=-1).astype(np.uint8)
-    return output
-
-def rgb_to_gray(img_rgb):
-    """Convert RGB to grayscale and return as 2D array."""
-    if img_rgb is None:
-        return None
-        
-    if img_rgb.ndim == 2:
-        return img_rgb
-    
-    if img_rgb.dtype != np.float32:
-        img_rgb = img_rgb.astype(np.float32)
-    
-    gray = np.dot(img_rgb[..., :3], [0.299, 0.587, 0.114])
-    return np.clip(gray, 0, 255).astype(np.uint8)
-
-def adjust_brightness_contrast(img_rgb, brightness=0, contrast=0):
-    """Adjust brightness and contrast with input validation."""
-    if img_rgb is None:
-        return None
-    
-    if img_rgb.dtype != np.uint8:
-        img_rgb = img_rgb.astype(np.uint8)
-    
-    img_bgr = to_opencv(img_rgb)
-    beta = brightness
-    alpha = 1 + (contrast / 100.0)
-    adjusted = cv2.convertScaleAbs(img_bgr, alpha=alpha, beta=beta)
-    return to_streamlit(adjusted)
-
-def image_to_bytes(img_array, fmt="PNG"):
-    """Convert numpy image array to bytes for download."""
-    if img_array is None:
-        raise ValueError("image_to_bytes received None image")
-    
-    if img_array.dtype != np.uint8:
-        img_array = np.clip(img_array, 0, 255).astype(np.uint8)
-    
-    if img_array.ndim == 2:
-        pil_img = Image.fromarray(img_array, mode='L')
-    elif img_array.ndim == 3:
-        if img_array.shape[2] == 3:
-            pil_img = Image.fromarray(img_array, mode='RGB')
-        elif img_array.shape[2] == 4:
-            pil_img = Image.fromarray(img_array, mode='RGBA')
-        else:
-            raise ValueError(f"Unexpected image shape: {img_array.shape}")
-    else:
-        raise ValueError(f"Unexpected image dimensions: {img_array.ndim}")
-    
-    buf = BytesIO()
-    
-    if fmt.upper() == "JPEG":
-        if img_array.ndim == 3 and img_array.shape[2] == 4:
-            pil_img = pil_img.convert('RGB')
-        elif img_array.ndim == 2:
-            pil_img = pil_img.convert('RGB')
-    
-    pil_img.save(buf, format=fmt)
-    return buf.getvalue()
+def process_pipeline(steps):
+    """Preview/export the queued pipeline (see image_processing.run_pipeline)."""
+    return process_image("pipeline", *pipeline_job(steps), cache_result=False)
+
+def live_preview_source():
+    """Small working copy for live previews and its scale relative to the original."""
+    width = st.session_state.get("live_preview_width", LIVE_PREVIEW_MAX_WIDTH)
+    tag = (st.session_state.get("original_digest"), width)
+    cached = st.session_state.get("live_proxy")
+    if cached is None or cached[0] != tag:
+        base = st.session_state.get("proxy_img")
+        base_scale = st.session_state.get("proxy_scale", 1.0)
+        if base is None:
+            base, base_scale = get_original(), 1.0
+        img, scale = make_proxy(base, width)
+        cached = (tag, img, base_scale * scale)
+        st.session_state["live_proxy"] = cached
+    return cached[1], cached[2]
+
+def render_live_preview(steps, caption):
+    """Show ``steps`` applied to the live working copy, on every rerun.
+
+    Sliders rerun the script when released, and the runner's fast reruns
+    abandon a run as soon as a newer change arrives, so stale frames are
+    skipped. The working copy halves after a frame over
+    LIVE_PREVIEW_BUDGET_S and grows back after clearly faster ones.
+    Results are cached by the pipeline runner, so revisiting a slider
+    value is instant and editing a late step of a queued pipeline reuses
+    the stages before it.
+    """
+    start = time.perf_counter()
+    img, scale = live_preview_source()
+    _, compute = pipeline_job(steps)
+    with stage(f"{steps[0][0] if len(steps) == 1 else 'pipeline'}.live"):
+        preview = compute(img, scale)
+    st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+    show_image(preview, caption=caption, use_column_width=True)
+    st.markdown('</div>', unsafe_allow_html=True)
 
-def compute_histogram(img_rgb):
-    """Compute and return histogram figure."""
-    if img_rgb is None:
-        return None
-        
-    img_bgr = to_opencv(img_rgb)
-    color = ('b', 'g', 'r')
-    fig, ax = plt.subplots(figsize=(8, 4))
-    for i, col in enumerate(color):
-        hist = cv2.calcHist([img_bgr], [i], None, [256], [0, 256])
-        ax.plot(hist, color=col)
-        ax.set_xlim([0, 256])
-    ax.set_title("Color Histogram")
-    ax.set_xlabel("Pixel value")
-    ax.set_ylabel("Frequency")
-    fig.tight_layout()
-    return fig
-
-def advanced_background_removal(img_rgb, method="hsv", bg_color=(255, 255, 255)):
-    """Advanced background removal with multiple methods."""
-    if img_rgb is None:
-        return None
-        
-    img_bgr = to_opencv(img_rgb)
-    
-    # Create mask for green background (assuming green screen)
-    hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
-    
-    # Define green color range
-    lower_green1 = np.array([35, 50, 50])
-    upper_green1 = np.array([85, 255, 255])
-    
-    # Alternative green range for better detection
-    lower_green2 = np.array([25, 40, 40])
-    upper_green2 = np.array([95, 255, 255])
-    
-    # Create masks
-    mask1 = cv2.inRange(hsv, lower_green1, upper_green1)
-    mask2 = cv2.inRange(hsv, lower_green2, upper_green2)
-    mask = cv2.bitwise_or(mask1, mask2)
-    
-    # Improve mask with morphological operations
-    kernel = np.ones((5, 5), np.uint8)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-    mask = cv2.dilate(mask, kernel, iterations=1)
-    
-    # Invert mask to get foreground
-    mask_inv = cv2.bitwise_not(mask)
-    
-    # Extract foreground
-    fg = cv2.bitwise_and(img_bgr, img_bgr, mask=mask_inv)
-    
-    if method == "hsv":
-        # White background
-        bg = np.full_like(img_bgr, bg_color, dtype=np.uint8)
-        bg = cv2.bitwise_and(bg, bg, mask=mask)
-        result = cv2.add(fg, bg)
-        
-    elif method == "blur_bg":
-        # Create blurred background
-        blurred_bg = cv2.GaussianBlur(img_bgr, (51, 51), 0)
-        bg = cv2.bitwise_and(blurred_bg, blurred_bg, mask=mask)
-        result = cv2.add(fg, bg)
-        
-    elif method == "transparent":
-        # Create RGBA image with transparency
-        rgba = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGBA)
-        rgba[:, :, 3] = mask_inv
-        result = rgba
-        
-    elif method == "grayscale_bg":
-        # Grayscale background
-        gray_bg = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-        gray_bg = cv2.cvtColor(gray_bg, cv2.COLOR_GRAY2BGR)
-        bg = cv2.bitwise_and(gray_bg, gray_bg, mask=mask)
-        result = cv2.add(fg, bg)
-        
-    elif method == "edge_detection_bg":
-        # Edge detection background
-        gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 100, 200)
-        edges_color = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
-        bg = cv2.bitwise_and(edges_color, edges_color, mask=mask)
-        result = cv2.add(fg, bg)
-        
-    else:
-        # Solid color background
-        if method == "red":
-            bg_color_bgr = (0, 0, 255)
-        elif method == "blue":
-            bg_color_bgr = (255, 0, 0)
-        elif method == "yellow":
-            bg_color_bgr = (0, 255, 255)
-        elif method == "green":
-            bg_color_bgr = (0, 255, 0)
-        elif method == "purple":
-            bg_color_bgr = (255, 0, 255)
-        elif method == "orange":
-            bg_color_bgr = (0, 165, 255)
-        elif method == "pink":
-            bg_color_bgr = (203, 192, 255)
-        elif method == "brown":
-            bg_color_bgr = (42, 42, 165)
-        elif method == "black":
-            bg_color_bgr = (0, 0, 0)
-        else:
-            bg_color_bgr = (255, 255, 255)
-        
-        bg = np.full_like(img_bgr, bg_color_bgr, dtype=np.uint8)
-        bg = cv2.bitwise_and(bg, bg, mask=mask)
-        result = cv2.add(fg, bg)
-    
-    if result.shape[2] == 4:
-        return result
+    elapsed = time.perf_counter() - start
+    width = st.session_state.get("live_preview_width", LIVE_PREVIEW_MAX_WIDTH)
+    if elapsed > LIVE_PREVIEW_BUDGET_S:
+        width = max(LIVE_PREVIEW_MIN_WIDTH, width // 2)
+    elif elapsed < LIVE_PREVIEW_BUDGET_S / 4:
+        width = min(LIVE_PREVIEW_MAX_WIDTH, width * 2)
+    st.session_state["live_preview_width"] = width
+
+def show_image(image, **kwargs):
+    """st.image, timed as the Streamlit serialization stage when profiling."""
+    with stage("st_image"):
+        st.image(image, **kwargs)
+
+def describe_step(step, t, details=True):
+    """Human readable label of a queued pipeline step, optionally with its parameters."""
+    kind, params = step
+    labels = {
+        "translation": "btn_translation",
+        "scaling": "btn_scaling",
+        "rotation": "btn_rotation",
+        "shearing": "btn_shearing",
+        "reflection": "btn_reflection",
+        "blur": "btn_blur",
+        "sharpen": "btn_sharpen",
+        "grayscale": "btn_grayscale",
+        "edges": "btn_edge",
+        "brightness": "btn_brightness",
+        "background": "btn_background",
+    }
+    if not details:
+        details = ""
+    elif kind == "reflection":
+        details = t[f"axis_{params['axis']}"]
     else:
-        return to_streamlit(result)
+        details = ", ".join(
+            f"{k}={v:g}" if isinstance(v, (int, float)) else f"{k}={v}" for k, v in params.items()
+        )
+    return f"{t[labels[kind]]} ({details})" if details else t[labels[kind]]
+
+def render_step_editor(index, step, t):
+    """Widgets for the parameters of queued step ``index``; returns the edited step."""
+    kind, params = step
+    params = dict(params)
+    key = f"stack_{index}_{kind}"
+    for param, label, low, high in STEP_SLIDERS.get(kind, []):
+        params[param] = st.slider(t[label], low, high, params[param], key=f"{key}_{param}")
+    for param, label, options, prefix in STEP_CHOICES.get(kind, []):
+        params[param] = st.selectbox(
+            t[label], options, index=options.index(params.get(param, options[0])),
+            format_func=lambda v, prefix=prefix: t[f"{prefix}{v}"] if prefix else str(v),
+            key=f"{key}_{param}"
+        )
+    return kind, params
+
+def render_stack_add_button(step, key_prefix):
+    """Button that queues a step on the processing pipeline."""
+    t = translations[st.session_state["language"]]
+    if st.button(t["btn_stack_add"], key=f"btn_stack_add_{key_prefix}", use_container_width=True):
+        st.session_state["pipeline_steps"].append(step)
+
+def lazy_image_bytes(source, fmt="PNG"):
+    """Return a zero-argument callable that encodes the image on demand.
+
+    ``source`` is an image array or a callable returning one (such as the
+    full-resolution renderer from process_image). Streamlit calls the
+    encoder only when the download button is clicked. The encoded blob is
+    memoized in the result cache under the image digest, so repeated
+    downloads of the same result encode once per format.
+    """
+    cache = get_result_cache()
+
+    def encode():
+        img_array = source() if callable(source) else source
+        key = (image_digest(img_array), "encode", fmt.upper())
+        return cache.get_or_compute(key, lambda: image_to_bytes(img_array, fmt=fmt))
+
+    return encode
+
+def render_download_buttons(source, file_stem, key_prefix):
+    """Show PNG and JPG download buttons that render and encode lazily on click."""
+    st.markdown('<div class="download-box">', unsafe_allow_html=True)
+    col_png, col_jpg = st.columns(2)
+    with col_png:
+        st.download_button(
+            label="⬇️ Download PNG",
+            data=lazy_image_bytes(source, "PNG"),
+            file_name=f"{file_stem}.png",
+            mime="image/png",
+            key=f"dl_{key_prefix}_png",
+            on_click="ignore",
+            use_container_width=True
+        )
+    with col_jpg:
+        st.download_button(
+            label="⬇️ Download JPG",
+            data=lazy_image_bytes(source, "JPEG"),
+            file_name=f"{file_stem}.jpg",
+            mime="image/jpeg",
+            key=f"dl_{key_prefix}_jpg",
+            on_click="ignore",
+            use_container_width=True
+        )
+    st.markdown('</div>', unsafe_allow_html=True)
 
 def get_method_description(method_name):
     """Get description for each background removal method."""
@@ -1141,25 +1311,46 @@ def get_method_color(method_name):
     
     return colors.get(method_name, "#9E9E9E"), text_color
 
+@st.cache_data(show_spinner=False)
+def _square_thumbnail_b64(path, mtime_ns, file_size, size):
+    """Base64 thumbnail, memoized in process and persisted on disk.
+
+    The disk file name combines a hash of the source path with a hash of
+    its mtime and size, so a changed source gets a new thumbnail and the
+    stale one is removed.
+    """
+    path_key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+    version_key = hashlib.sha1(f"{mtime_ns}|{file_size}|{size}".encode()).hexdigest()[:16]
+    cache_path = os.path.join(THUMBNAIL_CACHE_DIR, f"{path_key}-{version_key}.jpg")
+
+    try:
+        with open(cache_path, "rb") as f:
+            data = f.read()
+    except OSError:
+        data = make_square_thumbnail(path, size)
+        try:
+            os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+            for name in os.listdir(THUMBNAIL_CACHE_DIR):
+                if name.startswith(f"{path_key}-"):
+                    os.remove(os.path.join(THUMBNAIL_CACHE_DIR, name))
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # Read-only deployments still get the in-process cache
+    return base64.b64encode(data).decode()
+
+def square_thumbnail_b64(path, size=180):
+    """Return the cached base64 JPEG thumbnail of an image file."""
+    stat = os.stat(path)
+    return _square_thumbnail_b64(path, stat.st_mtime_ns, stat.st_size, size)
+
 def safe_display_square_image(path):
     """Display image in square format with proper cropping."""
     if os.path.exists(path):
         try:
-            img = Image.open(path)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            width, height = img.size
-            min_dim = min(width, height)
-            left = (width - min_dim) // 2
-            top = (height - min_dim) // 2
-            right = left + min_dim
-            bottom = top + min_dim
-            img_cropped = img.crop((left, top, right, bottom))
-            img_resized = img_cropped.resize((180, 180), Image.Resampling.LANCZOS)
-
-            buffered = BytesIO()
-            img_resized.save(buffered, format="JPEG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
+            img_str = square_thumbnail_b64(path)
 
             st.markdown(f"""
             <div class="team-photo-container">
@@ -1266,455 +1457,313 @@ st.markdown('</div>', unsafe_allow_html=True)
 page = st.session_state["current_page"]
 
 if page == "tools":
-    # ===================== UPLOAD GUIDE BOX =====================
-    st.markdown('<div class="explanation-box">', unsafe_allow_html=True)
-    st.markdown(f'### {t["upload_explanation_title"]}')
-    st.markdown(f'<div class="text-box">{t["upload_explanation_text"]}</div>', unsafe_allow_html=True)
-    st.markdown('</div>', unsafe_allow_html=True)
-    
-    # ===================== UPLOAD IMAGE BOX =====================
-    st.markdown('<div class="upload-area">', unsafe_allow_html=True)
-    st.markdown(f'### {t["upload_title"]}')
-    uploaded_file = st.file_uploader(
-        label=t["upload_label"],
-        type=["png", "jpg", "jpeg"],
-        key="image_uploader"
-    )
-    
-    if uploaded_file is not None:
-        original_img = load_image(uploaded_file)
-        st.session_state.original_img = original_img
-        st.markdown('<div class="success-box">', unsafe_allow_html=True)
-        st.success(t["upload_success"])
+    run_profile = None
+    if st.session_state.get("profile_mode", PROFILING_DEFAULT):
+        run_profile = Profile("tools").start()
+
+    try:
+        # ===================== UPLOAD GUIDE BOX =====================
+        st.markdown('<div class="explanation-box">', unsafe_allow_html=True)
+        st.markdown(f'### {t["upload_explanation_title"]}')
+        st.markdown(f'<div class="text-box">{t["upload_explanation_text"]}</div>', unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
-        st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-        st.image(
-            original_img,
-            caption=t["upload_preview"],
-            use_column_width=True
+    
+        # ===================== UPLOAD IMAGE BOX =====================
+        st.markdown('<div class="upload-area">', unsafe_allow_html=True)
+        st.markdown(f'### {t["upload_title"]}')
+        uploaded_file = st.file_uploader(
+            label=t["upload_label"],
+            type=["png", "jpg", "jpeg"],
+            key="image_uploader"
         )
+    
+        if uploaded_file is not None:
+            # Reruns keep the prepared upload; a new file is looked up by content
+            if (st.session_state.get("original_file_id") != uploaded_file.file_id
+                    or st.session_state.get("original_loader") is None):
+                digest, size, proxy_img, proxy_scale, load_original = load_upload(uploaded_file)
+                st.session_state.original_img = None
+                st.session_state["original_loader"] = load_original
+                st.session_state["original_size"] = size
+                st.session_state["original_file_id"] = uploaded_file.file_id
+                st.session_state["original_digest"] = digest
+                st.session_state["proxy_img"] = proxy_img
+                st.session_state["proxy_scale"] = proxy_scale
+            st.markdown('<div class="success-box">', unsafe_allow_html=True)
+            st.success(t["upload_success"])
+            st.markdown('</div>', unsafe_allow_html=True)
+            st.toggle(t["proxy_mode"], value=True, key="proxy_mode", help=t["proxy_help"])
+            st.toggle(t["live_preview"], value=True, key="live_preview", help=t["live_help"])
+            st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+            show_image(
+                st.session_state["proxy_img"] if st.session_state["proxy_mode"] else get_original(),
+                caption=t["upload_preview"],
+                use_column_width=True
+            )
+            st.markdown('</div>', unsafe_allow_html=True)
+        else:
+            st.markdown('<div class="info-box">', unsafe_allow_html=True)
+            st.info(t["upload_info"])
+            st.markdown('</div>', unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
-    else:
-        st.markdown('<div class="info-box">', unsafe_allow_html=True)
-        st.info(t["upload_info"])
-        st.markdown('</div>', unsafe_allow_html=True)
-        original_img = None
-    st.markdown('</div>', unsafe_allow_html=True)
     
-    if uploaded_file is not None:
-        original_img = st.session_state.original_img
+        if uploaded_file is not None:
         
-        # ===================== TOOLS TITLE BOX =====================
-        st.markdown('<div class="title-box">', unsafe_allow_html=True)
-        st.markdown(f'### {t["tools_title"]}')
-        st.markdown(f'<div class="text-box">{t["tools_subtitle"]}</div>', unsafe_allow_html=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+            # ===================== TOOLS TITLE BOX =====================
+            st.markdown('<div class="title-box">', unsafe_allow_html=True)
+            st.markdown(f'### {t["tools_title"]}')
+            st.markdown(f'<div class="text-box">{t["tools_subtitle"]}</div>', unsafe_allow_html=True)
+            st.markdown('</div>', unsafe_allow_html=True)
         
-        # Main tools columns
-        tools_col_left, tools_col_right = st.columns(2, gap="large")
+            # Main tools columns
+            tools_col_left, tools_col_right = st.columns(2, gap="large")
         
-        # ===================== GEOMETRIC TRANSFORMATIONS BOX =====================
-        with tools_col_left:
-            st.markdown('<div class="tools-box">', unsafe_allow_html=True)
-            st.markdown(f'### {t["geo_title"]}')
-            st.markdown(f'<div class="text-box">{t["geo_desc"]}</div>', unsafe_allow_html=True)
+            # ===================== GEOMETRIC TRANSFORMATIONS BOX =====================
+            with tools_col_left:
+                st.markdown('<div class="tools-box">', unsafe_allow_html=True)
+                st.markdown(f'### {t["geo_title"]}')
+                st.markdown(f'<div class="text-box">{t["geo_desc"]}</div>', unsafe_allow_html=True)
             
-            # Transformation buttons
-            trans_col1, trans_col2, trans_col3 = st.columns(3)
-            with trans_col1:
-                if st.button(t["btn_translation"], key="btn_trans_click", type="secondary", use_container_width=True):
-                    st.session_state["geo_transform"] = "translation"
-            with trans_col2:
-                if st.button(t["btn_scaling"], key="btn_scale_click", type="secondary", use_container_width=True):
-                    st.session_state["geo_transform"] = "scaling"
-            with trans_col3:
-                if st.button(t["btn_rotation"], key="btn_rot_click", type="secondary", use_container_width=True):
-                    st.session_state["geo_transform"] = "rotation"
+                # Transformation buttons
+                trans_col1, trans_col2, trans_col3 = st.columns(3)
+                with trans_col1:
+                    if st.button(t["btn_translation"], key="btn_trans_click", type="secondary", use_container_width=True):
+                        st.session_state["geo_transform"] = "translation"
+                with trans_col2:
+                    if st.button(t["btn_scaling"], key="btn_scale_click", type="secondary", use_container_width=True):
+                        st.session_state["geo_transform"] = "scaling"
+                with trans_col3:
+                    if st.button(t["btn_rotation"], key="btn_rot_click", type="secondary", use_container_width=True):
+                        st.session_state["geo_transform"] = "rotation"
             
-            trans_col4, trans_col5, _ = st.columns(3)
-            with trans_col4:
-                if st.button(t["btn_shearing"], key="btn_shear_click", type="secondary", use_container_width=True):
-                    st.session_state["geo_transform"] = "shearing"
-            with trans_col5:
-                if st.button(t["btn_reflection"], key="btn_refl_click", type="secondary", use_container_width=True):
-                    st.session_state["geo_transform"] = "reflection"
+                trans_col4, trans_col5, _ = st.columns(3)
+                with trans_col4:
+                    if st.button(t["btn_shearing"], key="btn_shear_click", type="secondary", use_container_width=True):
+                        st.session_state["geo_transform"] = "shearing"
+                with trans_col5:
+                    if st.button(t["btn_reflection"], key="btn_refl_click", type="secondary", use_container_width=True):
+                        st.session_state["geo_transform"] = "reflection"
             
-            # Transform parameter panel
-            if st.session_state["geo_transform"] == "translation":
-                st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["trans_settings"]}</div>', unsafe_allow_html=True)
-                dx = st.slider(t["trans_dx"], -200, 200, 0, key="trans_dx")
-                dy = st.slider(t["trans_dy"], -200, 200, 0, key="trans_dy")
-                if st.button(f"{t['btn_apply']} ✅", key="btn_apply_trans", type="primary", use_container_width=True):
-                    T = np.array([[1, 0, dx],
-                                  [0, 1, dy],
-                                  [0, 0, 1]], dtype=np.float32)
-                    translated_img = apply_affine_transform(original_img, T)
-                    st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                    st.image(translated_img, caption=t["trans_result"], use_column_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                # Transform parameter panel
+                if st.session_state["geo_transform"] == "translation":
+                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["trans_settings"]}</div>', unsafe_allow_html=True)
+                    dx = st.slider(t["trans_dx"], -200, 200, 0, key="trans_dx")
+                    dy = st.slider(t["trans_dy"], -200, 200, 0, key="trans_dy")
+                    trans_step = ("translation", {"dx": dx, "dy": dy})
+                    render_stack_add_button(trans_step, "trans")
+                    if st.session_state["live_preview"]:
+                        render_live_preview([trans_step], t["live_caption"])
+                    if st.button(f"{t['btn_apply']} ✅", key="btn_apply_trans", type="primary", use_container_width=True):
+                        translated_img, translated_full = process_geometry([trans_step])
+                        st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                        show_image(translated_img, caption=t["trans_result"], use_column_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
                     
-                    st.markdown('<div class="download-box">', unsafe_allow_html=True)
-                    col_png, col_jpg = st.columns(2)
-                    with col_png:
-                        st.download_button(
-                            label="⬇️ Download PNG",
-                            data=image_to_bytes(translated_img, fmt="PNG"),
-                            file_name="translation_result.png",
-                            mime="image/png",
-                            key="dl_trans_png",
-                            use_container_width=True
-                        )
-                    with col_jpg:
-                        st.download_button(
-                            label="⬇️ Download JPG",
-                            data=image_to_bytes(translated_img, fmt="JPEG"),
-                            file_name="translation_result.jpg",
-                            mime="image/jpeg",
-                            key="dl_trans_jpg",
-                            use_container_width=True
-                        )
+                        render_download_buttons(translated_full, "translation_result", "trans")
                     st.markdown('</div>', unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
             
-            elif st.session_state["geo_transform"] == "scaling":
-                st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["scale_settings"]}</div>', unsafe_allow_html=True)
-                sx = st.slider(t["scale_x"], 0.1, 3.0, 1.0, key="scale_x")
-                sy = st.slider(t["scale_y"], 0.1, 3.0, 1.0, key="scale_y")
-                if st.button(f"{t['btn_apply']} ✅", key="btn_apply_scale", type="primary", use_container_width=True):
-                    h, w = original_img.shape[:2]
-                    S = np.array([[sx, 0, 0],
-                                  [0, sy, 0],
-                                  [0, 0, 1]], dtype=np.float32)
-                    new_w = int(w * sx)
-                    new_h = int(h * sy)
-                    scaled_img = apply_affine_transform(original_img, S, output_size=(new_w, new_h))
-                    st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                    st.image(scaled_img, caption=t["scale_result"], use_column_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                elif st.session_state["geo_transform"] == "scaling":
+                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["scale_settings"]}</div>', unsafe_allow_html=True)
+                    sx = st.slider(t["scale_x"], 0.1, 3.0, 1.0, key="scale_x")
+                    sy = st.slider(t["scale_y"], 0.1, 3.0, 1.0, key="scale_y")
+                    scale_step = ("scaling", {"sx": sx, "sy": sy})
+                    render_stack_add_button(scale_step, "scale")
+                    if st.session_state["live_preview"]:
+                        render_live_preview([scale_step], t["live_caption"])
+                    if st.button(f"{t['btn_apply']} ✅", key="btn_apply_scale", type="primary", use_container_width=True):
+                        scaled_img, scaled_full = process_geometry([scale_step])
+                        st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                        show_image(scaled_img, caption=t["scale_result"], use_column_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
                     
-                    st.markdown('<div class="download-box">', unsafe_allow_html=True)
-                    col_png, col_jpg = st.columns(2)
-                    with col_png:
-                        st.download_button(
-                            label="⬇️ Download PNG",
-                            data=image_to_bytes(scaled_img, fmt="PNG"),
-                            file_name="scaling_result.png",
-                            mime="image/png",
-                            key="dl_scale_png",
-                            use_container_width=True
-                        )
-                    with col_jpg:
-                        st.download_button(
-                            label="⬇️ Download JPG",
-                            data=image_to_bytes(scaled_img, fmt="JPEG"),
-                            file_name="scaling_result.jpg",
-                            mime="image/jpeg",
-                            key="dl_scale_jpg",
-                            use_container_width=True
-                        )
+                        render_download_buttons(scaled_full, "scaling_result", "scale")
                     st.markdown('</div>', unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
             
-            elif st.session_state["geo_transform"] == "rotation":
-                st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["rot_settings"]}</div>', unsafe_allow_html=True)
-                angle = st.slider(t["rot_angle"], -180, 180, 0, key="rot_angle")
-                if st.button(f"{t['btn_apply']} ✅", key="btn_apply_rot", type="primary", use_container_width=True):
-                    h, w = original_img.shape[:2]
-                    cx, cy = w / 2, h / 2
-                    theta = np.deg2rad(angle)
-                    cos_t = np.cos(theta)
-                    sin_t = np.sin(theta)
-                    R = np.array([[cos_t, -sin_t, 0],
-                                  [sin_t,  cos_t, 0],
-                                  [0,      0,     1]], dtype=np.float32)
-                    T1 = np.array([[1, 0, -cx],
-                                   [0, 1, -cy],
-                                   [0, 0, 1]], dtype=np.float32)
-                    T2 = np.array([[1, 0, cx],
-                                   [0, 1, cy],
-                                   [0, 0, 1]], dtype=np.float32)
-                    M = T2 @ R @ T1
-                    rotated_img = apply_affine_transform(original_img, M)
-                    st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                    st.image(rotated_img, caption=t["rot_result"], use_column_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                elif st.session_state["geo_transform"] == "rotation":
+                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["rot_settings"]}</div>', unsafe_allow_html=True)
+                    angle = st.slider(t["rot_angle"], -180, 180, 0, key="rot_angle")
+                    rot_step = ("rotation", {"angle": angle})
+                    render_stack_add_button(rot_step, "rot")
+                    if st.session_state["live_preview"]:
+                        render_live_preview([rot_step], t["live_caption"])
+                    if st.button(f"{t['btn_apply']} ✅", key="btn_apply_rot", type="primary", use_container_width=True):
+                        rotated_img, rotated_full = process_geometry([rot_step])
+                        st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                        show_image(rotated_img, caption=t["rot_result"], use_column_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
                     
-                    st.markdown('<div class="download-box">', unsafe_allow_html=True)
-                    col_png, col_jpg = st.columns(2)
-                    with col_png:
-                        st.download_button(
-                            label="⬇️ Download PNG",
-                            data=image_to_bytes(rotated_img, fmt="PNG"),
-                            file_name="rotation_result.png",
-                            mime="image/png",
-                            key="dl_rot_png",
-                            use_container_width=True
-                        )
-                    with col_jpg:
-                        st.download_button(
-                            label="⬇️ Download JPG",
-                            data=image_to_bytes(rotated_img, fmt="JPEG"),
-                            file_name="rotation_result.jpg",
-                            mime="image/jpeg",
-                            key="dl_rot_jpg",
-                            use_container_width=True
-                        )
+                        render_download_buttons(rotated_full, "rotation_result", "rot")
                     st.markdown('</div>', unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
             
-            elif st.session_state["geo_transform"] == "shearing":
-                st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["shear_settings"]}</div>', unsafe_allow_html=True)
-                shear_x = st.slider(t["shear_x"], -1.0, 1.0, 0.0, key="shear_x")
-                shear_y = st.slider(t["shear_y"], -1.0, 1.0, 0.0, key="shear_y")
-                if st.button(f"{t['btn_apply']} ✅", key="btn_apply_shear", type="primary", use_container_width=True):
-                    Sh = np.array([[1,      shear_x, 0],
-                                   [shear_y, 1,      0],
-                                   [0,      0,      1]], dtype=np.float32)
-                    sheared_img = apply_affine_transform(original_img, Sh)
-                    st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                    st.image(sheared_img, caption=t["shear_result"], use_column_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                elif st.session_state["geo_transform"] == "shearing":
+                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["shear_settings"]}</div>', unsafe_allow_html=True)
+                    shear_x = st.slider(t["shear_x"], -1.0, 1.0, 0.0, key="shear_x")
+                    shear_y = st.slider(t["shear_y"], -1.0, 1.0, 0.0, key="shear_y")
+                    shear_step = ("shearing", {"shx": shear_x, "shy": shear_y})
+                    render_stack_add_button(shear_step, "shear")
+                    if st.session_state["live_preview"]:
+                        render_live_preview([shear_step], t["live_caption"])
+                    if st.button(f"{t['btn_apply']} ✅", key="btn_apply_shear", type="primary", use_container_width=True):
+                        sheared_img, sheared_full = process_geometry([shear_step])
+                        st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                        show_image(sheared_img, caption=t["shear_result"], use_column_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
                     
-                    st.markdown('<div class="download-box">', unsafe_allow_html=True)
-                    col_png, col_jpg = st.columns(2)
-                    with col_png:
-                        st.download_button(
-                            label="⬇️ Download PNG",
-                            data=image_to_bytes(sheared_img, fmt="PNG"),
-                            file_name="shearing_result.png",
-                            mime="image/png",
-                            key="dl_shear_png",
-                            use_container_width=True
-                        )
-                    with col_jpg:
-                        st.download_button(
-                            label="⬇️ Download JPG",
-                            data=image_to_bytes(sheared_img, fmt="JPEG"),
-                            file_name="shearing_result.jpg",
-                            mime="image/jpeg",
-                            key="dl_shear_jpg",
-                            use_container_width=True
-                        )
+                        render_download_buttons(sheared_full, "shearing_result", "shear")
                     st.markdown('</div>', unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
             
-            elif st.session_state["geo_transform"] == "reflection":
-                st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["refl_settings"]}</div>', unsafe_allow_html=True)
-                axis = st.selectbox(t["refl_axis"], [t["axis_x"], t["axis_y"], t["axis_diag"]], key="refl_axis")
-                if st.button(f"{t['btn_apply']} ✅", key="btn_apply_refl", type="primary", use_container_width=True):
-                    h, w = original_img.shape[:2]
-                    if axis == t["axis_x"]:
-                        Rf = np.array([[1, 0, 0],
-                                       [0, -1, h],
-                                       [0, 0, 1]], dtype=np.float32)
-                    elif axis == t["axis_y"]:
-                        Rf = np.array([[-1, 0, w],
-                                       [0, 1, 0],
-                                       [0, 0, 1]], dtype=np.float32)
-                    else:
-                        Rf = np.array([[0, 1, 0],
-                                       [1, 0, 0],
-                                       [0, 0, 1]], dtype=np.float32)
-                    reflected_img = apply_affine_transform(original_img, Rf)
-                    st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                    st.image(reflected_img, caption=t["refl_result"], use_column_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                elif st.session_state["geo_transform"] == "reflection":
+                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["refl_settings"]}</div>', unsafe_allow_html=True)
+                    axis = st.selectbox(
+                        t["refl_axis"], ["x", "y", "diag"],
+                        format_func=lambda a: t[f"axis_{a}"], key="refl_axis"
+                    )
+                    refl_step = ("reflection", {"axis": axis})
+                    render_stack_add_button(refl_step, "refl")
+                    if st.button(f"{t['btn_apply']} ✅", key="btn_apply_refl", type="primary", use_container_width=True):
+                        reflected_img, reflected_full = process_geometry([refl_step])
+                        st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                        show_image(reflected_img, caption=t["refl_result"], use_column_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
                     
-                    st.markdown('<div class="download-box">', unsafe_allow_html=True)
-                    col_png, col_jpg = st.columns(2)
-                    with col_png:
-                        st.download_button(
-                            label="⬇️ Download PNG",
-                            data=image_to_bytes(reflected_img, fmt="PNG"),
-                            file_name="reflection_result.png",
-                            mime="image/png",
-                            key="dl_refl_png",
-                            use_container_width=True
-                        )
-                    with col_jpg:
-                        st.download_button(
-                            label="⬇️ Download JPG",
-                            data=image_to_bytes(reflected_img, fmt="JPEG"),
-                            file_name="reflection_result.jpg",
-                            mime="image/jpeg",
-                            key="dl_refl_jpg",
-                            use_container_width=True
-                        )
+                        render_download_buttons(reflected_full, "reflection_result", "refl")
                     st.markdown('</div>', unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
             
-            st.markdown('</div>', unsafe_allow_html=True)  # Close tools-box
+            
+                st.markdown('</div>', unsafe_allow_html=True)  # Close tools-box
         
-        # ===================== FILTERING GAMBAR BOX =====================
-        with tools_col_right:
-            st.markdown('<div class="filter-box">', unsafe_allow_html=True)
-            st.markdown(f'### {t["filter_title"]}')
-            st.markdown(f'<div class="text-box">{t["filter_desc"]}</div>', unsafe_allow_html=True)
+            # ===================== FILTERING GAMBAR BOX =====================
+            with tools_col_right:
+                st.markdown('<div class="filter-box">', unsafe_allow_html=True)
+                st.markdown(f'### {t["filter_title"]}')
+                st.markdown(f'<div class="text-box">{t["filter_desc"]}</div>', unsafe_allow_html=True)
             
-            # Filter buttons
-            filter_col1, filter_col2, filter_col3 = st.columns(3)
-            with filter_col1:
-                if st.button(t["btn_blur"], key="btn_blur_click", type="secondary", use_container_width=True):
-                    st.session_state["image_filter"] = "blur"
-            with filter_col2:
-                if st.button(t["btn_sharpen"], key="btn_sharpen_click", type="secondary", use_container_width=True):
-                    st.session_state["image_filter"] = "sharpen"
-            with filter_col3:
-                if st.button(t["btn_background"], key="btn_bg_click", type="secondary", use_container_width=True):
-                    st.session_state["image_filter"] = "background"
+                # Filter buttons
+                filter_col1, filter_col2, filter_col3 = st.columns(3)
+                with filter_col1:
+                    if st.button(t["btn_blur"], key="btn_blur_click", type="secondary", use_container_width=True):
+                        st.session_state["image_filter"] = "blur"
+                with filter_col2:
+                    if st.button(t["btn_sharpen"], key="btn_sharpen_click", type="secondary", use_container_width=True):
+                        st.session_state["image_filter"] = "sharpen"
+                with filter_col3:
+                    if st.button(t["btn_background"], key="btn_bg_click", type="secondary", use_container_width=True):
+                        st.session_state["image_filter"] = "background"
             
-            filter_col4, filter_col5, filter_col6 = st.columns(3)
-            with filter_col4:
-                if st.button(t["btn_grayscale"], key="btn_gray_click", type="secondary", use_container_width=True):
-                    st.session_state["image_filter"] = "grayscale"
-            with filter_col5:
-                if st.button(t["btn_edge"], key="btn_edge_click", type="secondary", use_container_width=True):
-                    st.session_state["image_filter"] = "edge"
-            with filter_col6:
-                if st.button(t["btn_brightness"], key="btn_bright_click", type="secondary", use_container_width=True):
-                    st.session_state["image_filter"] = "brightness"
+                filter_col4, filter_col5, filter_col6 = st.columns(3)
+                with filter_col4:
+                    if st.button(t["btn_grayscale"], key="btn_gray_click", type="secondary", use_container_width=True):
+                        st.session_state["image_filter"] = "grayscale"
+                with filter_col5:
+                    if st.button(t["btn_edge"], key="btn_edge_click", type="secondary", use_container_width=True):
+                        st.session_state["image_filter"] = "edge"
+                with filter_col6:
+                    if st.button(t["btn_brightness"], key="btn_bright_click", type="secondary", use_container_width=True):
+                        st.session_state["image_filter"] = "brightness"
             
-            # Filter parameter panel
-            if st.session_state["image_filter"] == "blur":
-                st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["blur_settings"]}</div>', unsafe_allow_html=True)
-                kernel_size = st.selectbox(
-                    t["blur_kernel"],
-                    [3, 5, 7],
-                    index=0,
-                    key="blur_kernel_size"
-                )
-                if st.button(f"{t['btn_apply']} ✅", key="btn_apply_blur", type="primary", use_container_width=True):
-                    k = kernel_size
-                    blur_kernel = np.ones((k, k), dtype=np.float32) / (k * k)
-                    blurred_rgb = manual_convolution_rgb(original_img, blur_kernel)
+                # Filter parameter panel
+                if st.session_state["image_filter"] == "blur":
+                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["blur_settings"]}</div>', unsafe_allow_html=True)
+                    blur_mode = st.radio(
+                        t["blur_mode"],
+                        ["conv", "integral"],
+                        format_func=lambda m: t[f"blur_mode_{m}"],
+                        horizontal=True,
+                        key="blur_mode"
+                    )
+                    kernel_size = st.selectbox(
+                        t["blur_kernel"],
+                        BLUR_KERNEL_SIZES,
+                        index=0,
+                        key="blur_kernel_size"
+                    )
+                    render_stack_add_button(("blur", {"k": kernel_size, "mode": blur_mode}), "blur")
+                    if st.button(f"{t['btn_apply']} ✅", key="btn_apply_blur", type="primary", use_container_width=True):
+                        k = kernel_size
+
+                        blurred_rgb, blurred_full = process_image(
+                            "blur", {"k": k, "mode": blur_mode},
+                            lambda img, s: apply_operation(img, "blur", {"k": scale_kernel_size(k, s), "mode": blur_mode})
+                        )
                     
-                    st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                    st.image(blurred_rgb, caption=t["blur_result"], use_column_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                        st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                        show_image(blurred_rgb, caption=t["blur_result"], use_column_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
                     
-                    st.markdown('<div class="download-box">', unsafe_allow_html=True)
-                    col_png, col_jpg = st.columns(2)
-                    with col_png:
-                        st.download_button(
-                            label="⬇️ Download PNG",
-                            data=image_to_bytes(blurred_rgb, fmt="PNG"),
-                            file_name="blur_result.png",
-                            mime="image/png",
-                            key="dl_blur_png",
-                            use_container_width=True
-                        )
-                    with col_jpg:
-                        st.download_button(
-                            label="⬇️ Download JPG",
-                            data=image_to_bytes(blurred_rgb, fmt="JPEG"),
-                            file_name="blur_result.jpg",
-                            mime="image/jpeg",
-                            key="dl_blur_jpg",
-                            use_container_width=True
-                        )
+                        render_download_buttons(blurred_full, "blur_result", "blur")
                     st.markdown('</div>', unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
             
-            elif st.session_state["image_filter"] == "sharpen":
-                st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["sharpen_settings"]}</div>', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["sharpen_desc"]}</div>', unsafe_allow_html=True)
-                if st.button(f"{t['btn_apply']} ✅", key="btn_apply_sharpen", type="primary", use_container_width=True):
-                    gray = rgb_to_gray(original_img)
-                    sharpen_kernel = np.array(
-                        [[0, -1, 0],
-                         [-1, 5, -1],
-                         [0, -1, 0]],
-                        dtype=np.float32
-                    )
-                    sharpened_gray = manual_convolution_gray(gray, sharpen_kernel)
-                    
-                    if sharpened_gray.ndim == 2:
-                        sharpened_rgb = cv2.cvtColor(sharpened_gray, cv2.COLOR_GRAY2RGB)
-                    else:
-                        sharpened_rgb = sharpened_gray
+                elif st.session_state["image_filter"] == "sharpen":
+                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["sharpen_settings"]}</div>', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["sharpen_desc"]}</div>', unsafe_allow_html=True)
+                    render_stack_add_button(("sharpen", {}), "sharp")
+                    if st.button(f"{t['btn_apply']} ✅", key="btn_apply_sharpen", type="primary", use_container_width=True):
+                        sharpened_rgb, sharpened_full = process_image(
+                            "sharpen", {},
+                            lambda img, s: apply_operation(img, "sharpen")
+                        )
                     
-                    st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                    st.image(sharpened_rgb, caption=t["sharpen_result"], use_column_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                        st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                        show_image(sharpened_rgb, caption=t["sharpen_result"], use_column_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
                     
-                    st.markdown('<div class="download-box">', unsafe_allow_html=True)
-                    col_png, col_jpg = st.columns(2)
-                    with col_png:
-                        st.download_button(
-                            label="⬇️ Download PNG",
-                            data=image_to_bytes(sharpened_rgb, fmt="PNG"),
-                            file_name="sharpen_result.png",
-                            mime="image/png",
-                            key="dl_sharp_png",
-                            use_container_width=True
-                        )
-                    with col_jpg:
-                        st.download_button(
-                            label="⬇️ Download JPG",
-                            data=image_to_bytes(sharpened_rgb, fmt="JPEG"),
-                            file_name="sharpen_result.jpg",
-                            mime="image/jpeg",
-                            key="dl_sharp_jpg",
-                            use_container_width=True
-                        )
+                        render_download_buttons(sharpened_full, "sharpen_result", "sharp")
                     st.markdown('</div>', unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
             
-            elif st.session_state["image_filter"] == "background":
-                st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["bg_settings"]}</div>', unsafe_allow_html=True)
+                elif st.session_state["image_filter"] == "background":
+                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["bg_settings"]}</div>', unsafe_allow_html=True)
                 
-                # Background removal methods
-                bg_methods = [
-                    "HSV Color Thresholding",
-                    "Blur Background",
-                    "Remove Background (Transparent)",
-                    "Grayscale Background",
-                    "Edge Detection Background",
-                    "Solid Red Background",
-                    "Solid Blue Background",
-                    "Solid Yellow Background",
-                    "Solid Green Background",
-                    "Solid Purple Background",
-                    "Solid Orange Background",
-                    "Solid Pink Background",
-                    "Solid Brown Background",
-                    "Solid Black Background",
-                    "Solid White Background"
-                ]
+                    # Background removal methods
+                    bg_methods = [
+                        "HSV Color Thresholding",
+                        "Blur Background",
+                        "Remove Background (Transparent)",
+                        "Grayscale Background",
+                        "Edge Detection Background",
+                        "Solid Red Background",
+                        "Solid Blue Background",
+                        "Solid Yellow Background",
+                        "Solid Green Background",
+                        "Solid Purple Background",
+                        "Solid Orange Background",
+                        "Solid Pink Background",
+                        "Solid Brown Background",
+                        "Solid Black Background",
+                        "Solid White Background"
+                    ]
                 
-                method = st.selectbox(
-                    t["bg_method"],
-                    bg_methods,
-                    key="bg_method"
-                )
+                    method = st.selectbox(
+                        t["bg_method"],
+                        bg_methods,
+                        key="bg_method"
+                    )
                 
-                # Show method description
-                bg_color, text_color = get_method_color(method)
-                method_desc = get_method_description(method)
+                    # Show method description
+                    bg_color, text_color = get_method_color(method)
+                    method_desc = get_method_description(method)
                 
-                st.markdown(f"""
-                <div class="method-desc">
-                    <span class="color-tag" style="background-color: {bg_color}; color: {text_color};">
-                        {method}
-                    </span>
-                    <br>
-                    {method_desc}
-                </div>
-                """, unsafe_allow_html=True)
+                    st.markdown(f"""
+                    <div class="method-desc">
+                        <span class="color-tag" style="background-color: {bg_color}; color: {text_color};">
+                            {method}
+                        </span>
+                        <br>
+                        {method_desc}
+                    </div>
+                    """, unsafe_allow_html=True)
                 
-                st.markdown('<div class="warning-box">', unsafe_allow_html=True)
-                st.info("⚠️ **Catatan:** Untuk hasil terbaik, gunakan gambar dengan background hijau (green screen).")
-                st.markdown('</div>', unsafe_allow_html=True)
+                    st.markdown('<div class="warning-box">', unsafe_allow_html=True)
+                    st.info("⚠️ **Catatan:** Untuk hasil terbaik, gunakan gambar dengan background hijau (green screen).")
+                    st.markdown('</div>', unsafe_allow_html=True)
                 
-                if st.button(f"{t['btn_apply']} ✅", key="btn_apply_bg", type="primary", use_container_width=True):
                     # Map method name to method type
                     method_map = {
                         "HSV Color Thresholding": "hsv",
@@ -1735,200 +1784,176 @@ if page == "tools":
                     }
                     
                     method_type = method_map.get(method, "hsv")
+                    render_stack_add_button(("background", {"method": method_type}), "bg")
+                
+                    if st.button(f"{t['btn_apply']} ✅", key="btn_apply_bg", type="primary", use_container_width=True):
                     
-                    with st.spinner(f"Memproses {method}..."):
-                        bg_removed_img = advanced_background_removal(original_img, method_type, (255, 255, 255))
-                    
-                    if bg_removed_img is not None:
-                        # Check if image is RGBA (transparent)
-                        if bg_removed_img.shape[2] == 4:
-                            # Convert RGBA to RGB for display
-                            bg_display = cv2.cvtColor(bg_removed_img, cv2.COLOR_RGBA2RGB)
-                            st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                            st.image(bg_display, caption=f"{t['bg_result']} - {method}", use_column_width=True)
-                            st.markdown('</div>', unsafe_allow_html=True)
-                        else:
-                            st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                            st.image(bg_removed_img, caption=f"{t['bg_result']} - {method}", use_column_width=True)
-                            st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        st.markdown('<div class="download-box">', unsafe_allow_html=True)
-                        col_png, col_jpg = st.columns(2)
-                        with col_png:
-                            st.download_button(
-                                label="⬇️ Download PNG",
-                                data=image_to_bytes(bg_removed_img, fmt="PNG"),
-                                file_name=f"background_{method.lower().replace(' ', '_')}.png",
-                                mime="image/png",
-                                key="dl_bg_png",
-                                use_container_width=True
+                        with st.spinner(f"Memproses {method}..."):
+                            bg_mask = make_cached_green_screen_mask()
+                            bg_removed_img, bg_removed_full = process_image(
+                                "background_removal", {"method": method_type, "bg_color": (255, 255, 255)},
+                                lambda img, s: advanced_background_removal(
+                                    img, method_type, (255, 255, 255), mask=bg_mask(img, s)
+                                )
                             )
-                        with col_jpg:
-                            # For RGBA images, convert to RGB for JPG
+                    
+                        if bg_removed_img is not None:
+                            # Check if image is RGBA (transparent)
                             if bg_removed_img.shape[2] == 4:
-                                bg_rgb = cv2.cvtColor(bg_removed_img, cv2.COLOR_RGBA2RGB)
-                                st.download_button(
-                                    label="⬇️ Download JPG",
-                                    data=image_to_bytes(bg_rgb, fmt="JPEG"),
-                                    file_name=f"background_{method.lower().replace(' ', '_')}.jpg",
-                                    mime="image/jpeg",
-                                    key="dl_bg_jpg",
-                                    use_container_width=True
-                                )
+                                # Convert RGBA to RGB for display
+                                bg_display = cv2.cvtColor(bg_removed_img, cv2.COLOR_RGBA2RGB)
+                                st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                                show_image(bg_display, caption=f"{t['bg_result']} - {method}", use_column_width=True)
+                                st.markdown('</div>', unsafe_allow_html=True)
                             else:
-                                st.download_button(
-                                    label="⬇️ Download JPG",
-                                    data=image_to_bytes(bg_removed_img, fmt="JPEG"),
-                                    file_name=f"background_{method.lower().replace(' ', '_')}.jpg",
-                                    mime="image/jpeg",
-                                    key="dl_bg_jpg",
-                                    use_container_width=True
-                                )
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    else:
-                        st.markdown('<div class="warning-box">', unsafe_allow_html=True)
-                        st.error("Gagal memproses penghapusan background. Pastikan gambar memiliki background hijau untuk hasil terbaik.")
-                        st.markdown('</div>', unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
+                                st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                                show_image(bg_removed_img, caption=f"{t['bg_result']} - {method}", use_column_width=True)
+                                st.markdown('</div>', unsafe_allow_html=True)
+                        
+                            render_download_buttons(bg_removed_full, f"background_{method.lower().replace(' ', '_')}", "bg")
+                        else:
+                            st.markdown('<div class="warning-box">', unsafe_allow_html=True)
+                            st.error("Gagal memproses penghapusan background. Pastikan gambar memiliki background hijau untuk hasil terbaik.")
+                            st.markdown('</div>', unsafe_allow_html=True)
+                    st.markdown('</div>', unsafe_allow_html=True)
             
-            elif st.session_state["image_filter"] == "grayscale":
-                st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["gray_settings"]}</div>', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["gray_desc"]}</div>', unsafe_allow_html=True)
-                if st.button(f"{t['btn_apply']} ✅", key="btn_apply_gray", type="primary", use_container_width=True):
-                    gray_img = rgb_to_gray(original_img)
-                    if gray_img.ndim == 2:
-                        gray_rgb = cv2.cvtColor(gray_img, cv2.COLOR_GRAY2RGB)
-                    else:
-                        gray_rgb = gray_img
+                elif st.session_state["image_filter"] == "grayscale":
+                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["gray_settings"]}</div>', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["gray_desc"]}</div>', unsafe_allow_html=True)
+                    render_stack_add_button(("grayscale", {}), "gray")
+                    if st.button(f"{t['btn_apply']} ✅", key="btn_apply_gray", type="primary", use_container_width=True):
+                        gray_rgb, gray_full = process_image(
+                            "grayscale", {},
+                            lambda img, s: apply_operation(img, "grayscale")
+                        )
                     
-                    st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                    st.image(gray_rgb, caption=t["gray_result"], use_column_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                        st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                        show_image(gray_rgb, caption=t["gray_result"], use_column_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
                     
-                    st.markdown('<div class="download-box">', unsafe_allow_html=True)
-                    col_png, col_jpg = st.columns(2)
-                    with col_png:
-                        st.download_button(
-                            label="⬇️ Download PNG",
-                            data=image_to_bytes(gray_rgb, fmt="PNG"),
-                            file_name="grayscale_result.png",
-                            mime="image/png",
-                            key="dl_gray_png",
-                            use_container_width=True
-                        )
-                    with col_jpg:
-                        st.download_button(
-                            label="⬇️ Download JPG",
-                            data=image_to_bytes(gray_rgb, fmt="JPEG"),
-                            file_name="grayscale_result.jpg",
-                            mime="image/jpeg",
-                            key="dl_gray_jpg",
-                            use_container_width=True
-                        )
+                        render_download_buttons(gray_full, "grayscale_result", "gray")
                     st.markdown('</div>', unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
             
-            elif st.session_state["image_filter"] == "edge":
-                st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["edge_settings"]}</div>', unsafe_allow_html=True)
-                method_edge = st.selectbox(
-                    t["edge_method"], ["Sobel", "Canny"], key="edge_method"
-                )
-                if st.button(f"{t['btn_apply']} ✅", key="btn_apply_edge", type="primary", use_container_width=True):
-                    img_bgr = to_opencv(original_img)
-                    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-                    if method_edge == "Sobel":
-                        grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-                        grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-                        mag = cv2.magnitude(grad_x, grad_y)
-                        mag = np.clip(mag, 0, 255).astype(np.uint8)
-                        edge_bgr = cv2.cvtColor(mag, cv2.COLOR_GRAY2BGR)
-                    else:
-                        edges = cv2.Canny(gray, 100, 200)
-                        edge_bgr = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
-                    edge_img = to_streamlit(edge_bgr)
+                elif st.session_state["image_filter"] == "edge":
+                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["edge_settings"]}</div>', unsafe_allow_html=True)
+                    method_edge = st.selectbox(
+                        t["edge_method"], ["Sobel", "Canny"], key="edge_method"
+                    )
+                    render_stack_add_button(("edges", {"method": method_edge}), "edge")
+                    if st.button(f"{t['btn_apply']} ✅", key="btn_apply_edge", type="primary", use_container_width=True):
+                        edge_img, edge_full = process_image(
+                            "edges", {"method": method_edge},
+                            lambda img, s: apply_operation(img, "edges", {"method": method_edge})
+                        )
                     
-                    st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                    st.image(edge_img, caption=f"{t['edge_result']} ({method_edge})", use_column_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                        st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                        show_image(edge_img, caption=f"{t['edge_result']} ({method_edge})", use_column_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
                     
-                    st.markdown('<div class="download-box">', unsafe_allow_html=True)
-                    col_png, col_jpg = st.columns(2)
-                    with col_png:
-                        st.download_button(
-                            label="⬇️ Download PNG",
-                            data=image_to_bytes(edge_img, fmt="PNG"),
-                            file_name="edge_result.png",
-                            mime="image/png",
-                            key="dl_edge_png",
-                            use_container_width=True
+                        render_download_buttons(edge_full, "edge_result", "edge")
+                    st.markdown('</div>', unsafe_allow_html=True)
+            
+                elif st.session_state["image_filter"] == "brightness":
+                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
+                    st.markdown(f'<div class="text-box">{t["bright_settings"]}</div>', unsafe_allow_html=True)
+                    brightness = st.slider(t["bright_brightness"], -100, 100, 0, key="brightness_value")
+                    contrast = st.slider(t["bright_contrast"], -100, 100, 0, key="contrast_value")
+                    render_stack_add_button(("brightness", {"brightness": brightness, "contrast": contrast}), "bright")
+                    if st.session_state["live_preview"]:
+                        render_live_preview(
+                            [("brightness", {"brightness": brightness, "contrast": contrast})], t["live_caption"]
                         )
-                    with col_jpg:
-                        st.download_button(
-                            label="⬇️ Download JPG",
-                            data=image_to_bytes(edge_img, fmt="JPEG"),
-                            file_name="edge_result.jpg",
-                            mime="image/jpeg",
-                            key="dl_edge_jpg",
-                            use_container_width=True
+                    if st.button(f"{t['btn_apply']} ✅", key="btn_apply_bright", type="primary", use_container_width=True):
+                        adjusted_img, adjusted_full = process_image(
+                            "brightness_contrast", {"brightness": brightness, "contrast": contrast},
+                            lambda img, s: apply_operation(img, "brightness", {"brightness": brightness, "contrast": contrast})
                         )
+                    
+                        st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                        show_image(adjusted_img, caption=t["bright_result"], use_column_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
+                    
+                        render_download_buttons(adjusted_full, "brightness_contrast_result", "bright")
                     st.markdown('</div>', unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
             
-            elif st.session_state["image_filter"] == "brightness":
+                st.markdown('</div>', unsafe_allow_html=True)  # Close filter-box
+        
+            # ===================== PIPELINE BOX =====================
+            pipeline_steps = st.session_state["pipeline_steps"]
+            if pipeline_steps:
                 st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                st.markdown(f'<div class="text-box">{t["bright_settings"]}</div>', unsafe_allow_html=True)
-                brightness = st.slider(t["bright_brightness"], -100, 100, 0, key="brightness_value")
-                contrast = st.slider(t["bright_contrast"], -100, 100, 0, key="contrast_value")
-                if st.button(f"{t['btn_apply']} ✅", key="btn_apply_bright", type="primary", use_container_width=True):
-                    adjusted_img = adjust_brightness_contrast(original_img, brightness, contrast)
-                    
+                st.markdown(f'<div class="text-box">{t["stack_title"]}</div>', unsafe_allow_html=True)
+                st.markdown(f'<div class="text-box">{t["stack_desc"]}</div>', unsafe_allow_html=True)
+                for i, step in enumerate(pipeline_steps):
+                    # The label leaves out the parameters so the expander stays open while editing
+                    with st.expander(f"{i + 1}. {describe_step(step, t, details=False)}"):
+                        pipeline_steps[i] = render_step_editor(i, step, t)
+                if st.session_state["live_preview"]:
+                    render_live_preview(pipeline_steps, t["live_caption"])
+                stack_col1, stack_col2 = st.columns(2)
+                with stack_col1:
+                    if st.button(t["btn_stack_undo"], key="btn_stack_undo", use_container_width=True):
+                        pipeline_steps.pop()
+                        st.rerun()
+                with stack_col2:
+                    if st.button(t["btn_stack_clear"], key="btn_stack_clear", use_container_width=True):
+                        pipeline_steps.clear()
+                        st.rerun()
+                if st.button(f"{t['btn_stack_apply']} ✅", key="btn_apply_stack", type="primary", use_container_width=True):
+                    stacked_img, stacked_full = process_pipeline(pipeline_steps)
                     st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                    st.image(adjusted_img, caption=t["bright_result"], use_column_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    st.markdown('<div class="download-box">', unsafe_allow_html=True)
-                    col_png, col_jpg = st.columns(2)
-                    with col_png:
-                        st.download_button(
-                            label="⬇️ Download PNG",
-                            data=image_to_bytes(adjusted_img, fmt="PNG"),
-                            file_name="brightness_contrast_result.png",
-                            mime="image/png",
-                            key="dl_bright_png",
-                            use_container_width=True
-                        )
-                    with col_jpg:
-                        st.download_button(
-                            label="⬇️ Download JPG",
-                            data=image_to_bytes(adjusted_img, fmt="JPEG"),
-                            file_name="brightness_contrast_result.jpg",
-                            mime="image/jpeg",
-                            key="dl_bright_jpg",
-                            use_container_width=True
-                        )
+                    show_image(stacked_img, caption=t["stack_result"], use_column_width=True)
                     st.markdown('</div>', unsafe_allow_html=True)
+
+                    render_download_buttons(stacked_full, "pipeline_result", "stack")
                 st.markdown('</div>', unsafe_allow_html=True)
-            
-            st.markdown('</div>', unsafe_allow_html=True)  # Close filter-box
         
-        # ===================== HISTOGRAM BOX =====================
-        st.markdown('<div class="histogram-box" style="margin-top: 20px;">', unsafe_allow_html=True)
-        st.markdown(f'### {t["hist_title"]}')
-        st.markdown(f'<div class="text-box">{t["hist_desc"]}</div>', unsafe_allow_html=True)
-        if st.button(t["btn_histogram"], key="btn_histogram", type="secondary", use_container_width=True):
-            if original_img is not None:
-                hist_fig = compute_histogram(original_img)
-                st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
-                st.pyplot(hist_fig)
-                st.markdown('</div>', unsafe_allow_html=True)
-                plt.close(hist_fig)
-            else:
-                st.markdown('<div class="warning-box">', unsafe_allow_html=True)
-                st.warning(t["hist_warning"])
-                st.markdown('</div>', unsafe_allow_html=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+            # ===================== HISTOGRAM BOX =====================
+            st.markdown('<div class="histogram-box" style="margin-top: 20px;">', unsafe_allow_html=True)
+            st.markdown(f'### {t["hist_title"]}')
+            st.markdown(f'<div class="text-box">{t["hist_desc"]}</div>', unsafe_allow_html=True)
+            if st.button(t["btn_histogram"], key="btn_histogram", type="secondary", use_container_width=True):
+                original_img = get_original()
+                if original_img is not None:
+                    with stage("histogram"):
+                        hist_fig = compute_histogram(original_img)
+                    st.markdown('<div class="image-preview-box">', unsafe_allow_html=True)
+                    with stage("st_pyplot"):
+                        st.pyplot(hist_fig)
+                    st.markdown('</div>', unsafe_allow_html=True)
+                else:
+                    st.markdown('<div class="warning-box">', unsafe_allow_html=True)
+                    st.warning(t["hist_warning"])
+                    st.markdown('</div>', unsafe_allow_html=True)
+            st.markdown('</div>', unsafe_allow_html=True)
+    finally:
+        if run_profile is not None:
+            run_profile.stop()
+
+    # ===================== DEBUG PANEL =====================
+    with st.expander(t["debug_title"]):
+        st.toggle(t["profile_mode"], value=PROFILING_DEFAULT, key="profile_mode", help=t["profile_help"])
+        if run_profile is None:
+            st.caption(t["profile_empty"])
+        else:
+            st.dataframe(
+                [
+                    {
+                        t["profile_stage"]: "\u2003" * r["depth"] + r["stage"],
+                        "ms": round(r["seconds"] * 1000, 2),
+                        "peak MiB": None if r["peak_bytes"] is None else round(r["peak_bytes"] / 2**20, 2),
+                    }
+                    for r in run_profile.records
+                ],
+                hide_index=True,
+                use_container_width=True
+            )
+            cache_stats = get_result_cache().stats()
+            st.caption(t["profile_total"].format(
+                ms=run_profile.total_seconds * 1000, hits=cache_stats["hits"], misses=cache_stats["misses"]
+            ))
 
 # ===================== TEAM MEMBERS PAGE =====================
 elif page == "team":
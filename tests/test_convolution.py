@@ -0,0 +1,137 @@
+"""Numerical equivalence of the convolution engine with the original loop.
+
+Run from the repository root:
+
+    python -m pytest tests
+
+reference_convolution_gray is the per-pixel loop the app shipped with;
+every backend must match it to within one gray level (float32 sums in a
+different order can land on the other side of an integer boundary).
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processing import (  # noqa: E402
+    SHARPEN_KERNEL,
+    box_blur_integral,
+    manual_convolution_gray,
+    manual_convolution_rgb,
+)
+
+BACKENDS = ["direct", "separable", "fft"]
+KERNELS = {
+    "box3": np.ones((3, 3), dtype=np.float32) / 9,
+    "box7": np.ones((7, 7), dtype=np.float32) / 49,
+    "sharpen": SHARPEN_KERNEL,
+    "asymmetric3x5": np.array([[0, 1, 2, 1, 0],
+                               [-1, 0, 3, 0, 1],
+                               [0, -2, 1, 0, 0]], dtype=np.float32) / 4,
+    "asymmetric_separable": np.outer([1, 2, 3], [1, -1, 0, 2]).astype(np.float32) / 6,
+    "row1x5": np.array([[1, 2, 4, 2, 1]], dtype=np.float32) / 10,
+    "even2x2": np.ones((2, 2), dtype=np.float32) / 4,
+    "even4x4": np.ones((4, 4), dtype=np.float32) / 16,
+}
+SHAPES = {
+    "1x1": (1, 1),
+    "2x3": (2, 3),
+    "5x1": (5, 1),
+    "small": (23, 31),
+    "band_edge": (33, 17),  # one row more than CONV_BAND_ROWS
+}
+
+
+def reference_convolution_gray(img_gray, kernel):
+    """The original per-pixel loop of manual_convolution_gray."""
+    k_h, k_w = kernel.shape
+    pad_h = k_h // 2
+    pad_w = k_w // 2
+
+    img_float = img_gray.astype(np.float32)
+    padded = np.pad(img_float, ((pad_h, pad_h), (pad_w, pad_w)), mode="reflect")
+    h, w = img_gray.shape
+    output = np.zeros((h, w), dtype=np.float32)
+
+    for i in range(h):
+        for j in range(w):
+            region = padded[i:i + k_h, j:j + k_w]
+            output[i, j] = np.sum(region * kernel)
+
+    output = np.clip(output, 0, 255)
+    return output.astype(np.uint8)
+
+
+def reference_convolution(img, kernel):
+    """Loop reference for gray, RGB and RGBA (alpha is passed through)."""
+    if img.ndim == 2:
+        return reference_convolution_gray(img, kernel)
+    output = img.copy()
+    for c in range(min(img.shape[2], 3)):
+        output[:, :, c] = reference_convolution_gray(img[:, :, c], kernel)
+    return output
+
+
+def random_image(shape, channels, seed=0):
+    rng = np.random.default_rng(seed)
+    size = shape if channels is None else shape + (channels,)
+    return rng.integers(0, 256, size=size, dtype=np.uint8)
+
+
+def is_separable(kernel):
+    singular_values = np.linalg.svd(kernel.astype(np.float64), compute_uv=False)
+    return min(kernel.shape) == 1 or singular_values[1] <= 1e-6 * singular_values[0]
+
+
+def assert_close(result, expected):
+    assert result.shape == expected.shape
+    assert result.dtype == np.uint8
+    diff = np.abs(result.astype(np.int16) - expected.astype(np.int16))
+    assert diff.max(initial=0) <= 1
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("kernel_name", KERNELS)
+@pytest.mark.parametrize("shape_name", SHAPES)
+@pytest.mark.parametrize("channels", [None, 3, 4], ids=["gray", "rgb", "rgba"])
+def test_matches_reference_loop(backend, kernel_name, shape_name, channels):
+    kernel = KERNELS[kernel_name]
+    if backend == "separable" and not is_separable(kernel):
+        pytest.skip("kernel is not separable")
+    img = random_image(SHAPES[shape_name], channels)
+
+    if channels is None:
+        result = manual_convolution_gray(img, kernel, backend=backend)
+    else:
+        result = manual_convolution_rgb(img, kernel, backend=backend)
+    assert_close(result, reference_convolution(img, kernel))
+
+
+@pytest.mark.parametrize("kernel_name", KERNELS)
+def test_auto_backend_matches_reference_loop(kernel_name):
+    kernel = KERNELS[kernel_name]
+    img = random_image((40, 50), 3, seed=1)
+    assert_close(manual_convolution_rgb(img, kernel), reference_convolution(img, kernel))
+
+
+def test_rgba_alpha_is_unchanged():
+    img = random_image((20, 20), 4, seed=2)
+    result = manual_convolution_rgb(img, KERNELS["box3"])
+    np.testing.assert_array_equal(result[:, :, 3], img[:, :, 3])
+
+
+def test_separable_backend_rejects_non_separable_kernel():
+    with pytest.raises(ValueError):
+        manual_convolution_gray(random_image((8, 8), None), SHARPEN_KERNEL, backend="separable")
+
+
+@pytest.mark.parametrize("k", [3, 4, 5, 9, 15, 25, 51, 101])
+@pytest.mark.parametrize("shape", [(1, 1, 3), (2, 3, 3), (5, 4), (7, 9, 4), (40, 50, 3)],
+                         ids=["1x1", "2x3", "gray5x4", "rgba7x9", "40x50"])
+def test_box_blur_integral_matches_box_convolution(k, shape):
+    img = random_image(shape[:2], shape[2] if len(shape) == 3 else None, seed=k)
+    box = np.ones((k, k), dtype=np.float32) / (k * k)
+    assert_close(box_blur_integral(img, k), manual_convolution_rgb(img, box))
@@ -0,0 +1,18 @@
+"""Import-time budget of image_processing (see benchmarks/import_time.py).
+
+Run from the repository root:
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.import_time import BUDGET_S, measure_import  # noqa: E402
+
+
+def test_import_stays_light_and_within_budget():
+    best, loaded = measure_import(repeat=3)
+    assert loaded == [], f"imported at module load: {', '.join(loaded)}"
+    assert best <= BUDGET_S, f"import took {best:.3f}s (budget {BUDGET_S:.3f}s)"
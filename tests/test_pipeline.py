@@ -0,0 +1,126 @@
+"""Pipeline execution (image_processing.run_pipeline) against step-by-step runs.
+
+Run from the repository root:
+
+    python -m pytest tests
+"""
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processing import (  # noqa: E402
+    BACKGROUND_METHODS,
+    GEOMETRIC_OPERATIONS,
+    OPERATIONS,
+    ResultCache,
+    advanced_background_removal,
+    apply_geometric_steps,
+    run_pipeline,
+)
+
+# Taller than TILE_ROWS, so tiled segments run in several strips
+TALL_SHAPE = (1100, 40)
+STEP_POOL = [
+    ("blur", {"k": 3}),
+    ("blur", {"k": 5, "mode": "integral"}),
+    ("blur", {"k": 4, "mode": "integral"}),
+    ("sharpen", {}),
+    ("grayscale", {}),
+    ("edges", {"method": "Sobel"}),
+    ("edges", {"method": "Canny"}),
+    ("brightness", {"brightness": 30, "contrast": 20}),
+    ("brightness", {"brightness": -40, "contrast": -30}),
+    ("brightness", {"brightness": 10, "contrast": 60}),
+    ("background", {"method": "blur_bg"}),
+    ("background", {"method": "red"}),
+    ("background", {"method": "transparent"}),
+    ("rotation", {"angle": 7}),
+    ("scaling", {"sx": 1.2, "sy": 0.8}),
+    ("translation", {"dx": 5, "dy": -3}),
+    ("shearing", {"shx": 0.1, "shy": 0.0}),
+    ("reflection", {"axis": "y"}),
+]
+POINTWISE_CHAINS = [
+    [("brightness", {"brightness": 40, "contrast": 30}), ("grayscale", {}),
+     ("brightness", {"brightness": -25, "contrast": 50})],
+    [("grayscale", {}), ("brightness", {"brightness": 15, "contrast": -20}), ("grayscale", {}),
+     ("brightness", {"brightness": 60, "contrast": 10})],
+    [("brightness", {"brightness": -70, "contrast": 90}), ("brightness", {"brightness": 20, "contrast": -50}),
+     ("grayscale", {}), ("grayscale", {})],
+    [("blur", {"k": 3}), ("brightness", {"brightness": 40, "contrast": 30}), ("grayscale", {}),
+     ("brightness", {"brightness": -25, "contrast": 50}), ("sharpen", {})],
+]
+
+
+def green_screen_image(height=48, width=64, seed=0):
+    """Noisy RGB image whose left third is a green-screen backdrop."""
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    img[:, : width // 3] = (40, 180, 60)
+    return img
+
+
+@pytest.mark.parametrize("method", [m for m in BACKGROUND_METHODS if m != "transparent"])
+def test_background_after_transparent_drops_alpha(method):
+    img = green_screen_image()
+    steps = [("background", {"method": "transparent"}), ("background", {"method": method})]
+    result = run_pipeline(img, steps)
+    np.testing.assert_array_equal(result, advanced_background_removal(img, method))
+
+
+def step_by_step(img, steps):
+    for name, params in steps:
+        img = OPERATIONS[name](img, **params)
+    return img
+
+
+def random_chains(count, seed=0):
+    """Random step chains without adjacent geometric steps (those are composed)."""
+    rng = random.Random(seed)
+    chains = []
+    while len(chains) < count:
+        chain = [rng.choice(STEP_POOL) for _ in range(rng.randint(2, 6))]
+        names = [name for name, _ in chain]
+        if any(a in GEOMETRIC_OPERATIONS and b in GEOMETRIC_OPERATIONS for a, b in zip(names, names[1:])):
+            continue
+        chains.append(chain)
+    return chains
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+@pytest.mark.parametrize("cached", [False, True], ids=["uncached", "cached"])
+@pytest.mark.parametrize("steps", POINTWISE_CHAINS + random_chains(40),
+                         ids=lambda steps: "-".join(name for name, _ in steps))
+def test_pipeline_matches_step_by_step(steps, cached, workers):
+    img = green_screen_image(*TALL_SHAPE, seed=len(steps))
+    expected = step_by_step(img, steps)
+    cache = ResultCache() if cached else None
+    result = run_pipeline(img, steps, workers=workers, cache=cache)
+    np.testing.assert_array_equal(result, expected)
+    if cached:
+        # A second run is served from the stage cache
+        np.testing.assert_array_equal(run_pipeline(img, steps, workers=workers, cache=cache), expected)
+
+
+def test_pipeline_reuses_cached_prefix():
+    img = green_screen_image(*TALL_SHAPE)
+    cache = ResultCache()
+    head = [("background", {"method": "blur_bg"}), ("blur", {"k": 3})]
+    run_pipeline(img, head + [("brightness", {"brightness": 10, "contrast": 0})], cache=cache)
+    entries = cache.stats()["entries"]
+    steps = head + [("brightness", {"brightness": 50, "contrast": 0})]
+    result = run_pipeline(img, steps, cache=cache)
+    # Only the changed brightness stage was added; earlier stages were reused
+    assert cache.stats()["entries"] == entries + 1
+    np.testing.assert_array_equal(result, step_by_step(img, steps))
+
+
+def test_adjacent_geometric_steps_are_composed():
+    img = green_screen_image()
+    steps = [("rotation", {"angle": 20}), ("scaling", {"sx": 1.5, "sy": 0.7}), ("translation", {"dx": 4, "dy": 2})]
+    np.testing.assert_array_equal(run_pipeline(img, steps), apply_geometric_steps(img, steps))
@@ -0,0 +1,76 @@
+"""Stage profiling (image_processing.Profile) and its use of tracemalloc.
+
+Run from the repository root:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+import tracemalloc
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processing import Profile, stage  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def no_tracing():
+    if tracemalloc.is_tracing():
+        pytest.skip("tracemalloc is already tracing")
+    yield
+    assert not tracemalloc.is_tracing()
+
+
+def test_overlapping_profiles_keep_tracing_until_the_last_stops():
+    # Sessions run in their own threads, so their profiles overlap in any order
+    first_stopped = threading.Event()
+    second_started = threading.Event()
+    second = Profile("second")
+
+    def session():
+        second.start()
+        second_started.set()
+        first_stopped.wait()
+        with stage("after_first"):
+            pass
+        second.stop()
+
+    first = Profile("first").start()
+    thread = threading.Thread(target=session)
+    thread.start()
+    second_started.wait()
+    first.stop()
+    still_tracing = tracemalloc.is_tracing()
+    first_stopped.set()
+    thread.join()
+    assert still_tracing
+    assert not tracemalloc.is_tracing()
+    assert [record["stage"] for record in second.records] == ["after_first"]
+    assert second.records[0]["peak_bytes"] is not None
+
+
+def test_profile_stopped_twice_counts_once():
+    outer = Profile("outer").start()
+    inner = Profile("inner").start()
+    inner.stop()
+    inner.stop()
+    assert tracemalloc.is_tracing()
+    outer.stop()
+
+
+def test_profile_leaves_external_tracing_running():
+    tracemalloc.start()
+    try:
+        with Profile("nested"):
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_profile_without_memory_does_not_trace():
+    with Profile("timing", trace_memory=False):
+        assert not tracemalloc.is_tracing()
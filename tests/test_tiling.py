@@ -0,0 +1,88 @@
+"""Tiled execution (process_tiled, apply_operation) and the streaming PNG writer.
+
+Run from the repository root:
+
+    python -m pytest tests
+"""
+import os
+import sys
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processing import (  # noqa: E402
+    OPERATIONS,
+    TILE_HALOS,
+    apply_operation,
+    iter_operation_tiles,
+    tile_halo,
+    write_png_strips,
+)
+
+# Parameter sets for every TILE_HALOS entry
+TILED_CASES = [
+    ("blur", {"k": 3}),
+    ("blur", {"k": 4}),
+    ("blur", {"k": 7}),
+    ("blur", {"k": 3, "mode": "integral"}),
+    ("blur", {"k": 4, "mode": "integral"}),
+    ("blur", {"k": 15, "mode": "integral"}),
+    ("sharpen", {}),
+    ("grayscale", {}),
+    ("edges", {"method": "Sobel"}),
+    ("brightness", {"brightness": 25, "contrast": -40}),
+]
+
+
+def random_image(shape, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=shape, dtype=np.uint8)
+
+
+def case_id(case):
+    name, params = case
+    return "-".join([name] + [f"{k}={v}" for k, v in params.items()])
+
+
+def test_cases_cover_every_tileable_operation():
+    assert {name for name, _ in TILED_CASES} == set(TILE_HALOS)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+@pytest.mark.parametrize("tile_rows", [1, 7, 64])
+@pytest.mark.parametrize("case", TILED_CASES, ids=case_id)
+def test_tiled_matches_whole_image(case, tile_rows, workers):
+    name, params = case
+    img = random_image((100, 37, 3))
+    result = apply_operation(img, name, params, tile_rows=tile_rows, workers=workers)
+    np.testing.assert_array_equal(result, OPERATIONS[name](img, **params))
+
+
+@pytest.mark.parametrize("case", TILED_CASES, ids=case_id)
+def test_iter_operation_tiles_matches_whole_image(case):
+    name, params = case
+    img = random_image((90, 33, 3), seed=1)
+    strips = list(iter_operation_tiles(img, name, params, tile_rows=16))
+    assert len(strips) == 6
+    np.testing.assert_array_equal(np.concatenate(strips), OPERATIONS[name](img, **params))
+
+
+def test_canny_is_not_tiled():
+    assert tile_halo("edges", {"method": "Canny"}) is None
+    with pytest.raises(ValueError):
+        iter_operation_tiles(random_image((10, 10, 3)), "edges", {"method": "Canny"})
+
+
+@pytest.mark.parametrize("shape", [(45, 31), (45, 31, 3), (45, 31, 4), (1, 1, 3)],
+                         ids=["gray", "rgb", "rgba", "single_pixel"])
+def test_png_strips_round_trip(shape):
+    img = random_image(shape, seed=2)
+    buffer = BytesIO()
+    write_png_strips(buffer, np.array_split(img, min(4, shape[0])), shape[0])
+    buffer.seek(0)
+    with Image.open(buffer) as decoded:
+        np.testing.assert_array_equal(np.asarray(decoded), img)